@@ -0,0 +1,90 @@
+import math
+import os
+import struct
+
+import numpy as np
+
+
+class BloomFilter:
+    """Memory-mapped Bloom filter over 64-bit keys, queried and updated in vectorized batches."""
+
+    MAGIC = b"DDBLOOM1"
+    # magic, bit count, hash count, capacity, synced key count, false-positive rate
+    HEADER = struct.Struct("<8sQIQQd")
+    HEADER_SIZE = 64
+
+    def __init__(self, path, capacity=1_000_000, fp_rate=0.001):
+        self.path = path
+        if not os.path.exists(path):
+            BloomFilter.create(path, capacity, fp_rate)
+        with open(path, "rb") as handle:
+            magic, self.bits, self.hashes, self.capacity, self.synced, self.fp_rate = \
+                BloomFilter.HEADER.unpack(handle.read(BloomFilter.HEADER.size))
+        if magic != BloomFilter.MAGIC:
+            raise ValueError(f"Not a Bloom filter file: {path}")
+        self.array = np.memmap(path, dtype=np.uint8, mode="r+", offset=BloomFilter.HEADER_SIZE,
+                               shape=(self.bits + 7) // 8)
+
+    @staticmethod
+    def optimal_size(capacity, fp_rate):
+        """Bit and hash counts that keep the false-positive rate at fp_rate for capacity keys."""
+        capacity = max(int(capacity), 1)
+        bits = math.ceil(-capacity * math.log(fp_rate) / math.log(2) ** 2)
+        hashes = max(1, round(bits / capacity * math.log(2)))
+        return bits, hashes
+
+    @staticmethod
+    def create(path, capacity, fp_rate):
+        bits, hashes = BloomFilter.optimal_size(capacity, fp_rate)
+        with open(path, "wb") as handle:
+            handle.write(BloomFilter.HEADER.pack(BloomFilter.MAGIC, bits, hashes, capacity, 0, fp_rate)
+                         .ljust(BloomFilter.HEADER_SIZE, b"\0"))
+            # Sparse on most filesystems; the zeroed bit array costs nothing until it is written
+            handle.truncate(BloomFilter.HEADER_SIZE + (bits + 7) // 8)
+
+    @staticmethod
+    def mix(keys):
+        """splitmix64 finalizer, giving a second hash independent of the key itself."""
+        with np.errstate(over="ignore"):
+            z = keys + np.uint64(0x9E3779B97F4A7C15)
+            z = (z ^ (z >> np.uint64(30))) * np.uint64(0xBF58476D1CE4E5B9)
+            z = (z ^ (z >> np.uint64(27))) * np.uint64(0x94D049BB133111EB)
+            return z ^ (z >> np.uint64(31))
+
+    def positions(self, keys):
+        """Bit positions of every key, shape (len(keys), hashes), by double hashing."""
+        keys = np.asarray(keys).view(np.uint64).reshape(-1, 1)
+        step = BloomFilter.mix(keys) | np.uint64(1)
+        rounds = np.arange(self.hashes, dtype=np.uint64).reshape(1, -1)
+        with np.errstate(over="ignore"):
+            return (keys + rounds * step) % np.uint64(self.bits)
+
+    def add(self, keys):
+        positions = self.positions(keys).ravel()
+        # bitwise_or.at applies repeated byte indices one after another instead of keeping only the last
+        np.bitwise_or.at(self.array, (positions >> np.uint64(3)).astype(np.int64),
+                         (np.uint8(1) << (positions & np.uint64(7)).astype(np.uint8)))
+
+    def contains(self, keys):
+        """Boolean mask: False means the key was certainly never added."""
+        positions = self.positions(keys)
+        bytes_ = self.array[(positions >> np.uint64(3)).astype(np.int64)]
+        return ((bytes_ >> (positions & np.uint64(7)).astype(np.uint8)) & 1).all(axis=1).astype(bool)
+
+    def clear(self):
+        self.array[:] = 0
+        self.synced = 0
+
+    def flush(self, synced=None):
+        """Write the bits back to disk, then record how many index keys they are known to cover."""
+        self.array.flush()
+        if synced is not None:
+            self.synced = synced
+        with open(self.path, "r+b") as handle:
+            handle.write(BloomFilter.HEADER.pack(BloomFilter.MAGIC, self.bits, self.hashes, self.capacity,
+                                                 self.synced, self.fp_rate))
+
+    def close(self):
+        self.array.flush()
+        # Drop the mapping; np.memmap releases the file when the last reference goes
+        del self.array
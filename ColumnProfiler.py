@@ -0,0 +1,87 @@
+import numpy as np
+
+
+class ColumnProfiler:
+    # Upper bound on the number of rows inspected per column, whatever the file size
+    SAMPLE_SIZE = 200
+    # Share of non-empty sampled values that must match before a type is assigned
+    MIN_MATCH_SHARE = 0.8
+
+    # Content patterns, checked in order; the first one that clears MIN_MATCH_SHARE wins
+    PATTERNS = [
+        ("Email", r"^[\w.+\-]+@[\w\-]+(?:\.[\w\-]+)+$"),
+        ("Phone", r"^\+?1?[\s\-.]?\(?\d{3}\)?[\s\-.]?\d{3}[\s\-.]?\d{4}$"),
+        ("Zip", r"^\d{5}(?:-?\d{4})?$"),
+        # At least three letters up front, so state codes ('TX') do not pass for names
+        ("Name", r"^[A-Za-z][A-Za-z'\-.]{2,}(?: [A-Za-z][A-Za-z'\-.]*){0,2}$"),
+    ]
+    # Share of distinct values among the sampled ones a type needs; a city column repeats a few
+    # words ('Houston', 'Waco') where people's names hardly repeat
+    MIN_DISTINCT_SHARE = {"Name": 0.5}
+
+    @staticmethod
+    def is_unlabeled(column):
+        """Columns with a blank header cell come back from pandas as 'Unnamed: N'."""
+        name = str(column).strip()
+        return not name or name.startswith("Unnamed:")
+
+    @staticmethod
+    def sample_column(series, sample_size=SAMPLE_SIZE):
+        """Take evenly spaced rows from the column so the cost does not grow with the file."""
+        if len(series) > sample_size:
+            positions = np.unique(np.linspace(0, len(series) - 1, sample_size).astype(np.int64))
+            series = series.iloc[positions]
+        values = series.dropna().astype(str).str.strip()
+        # Numeric columns with gaps are read as floats, so phones and zips come back as '85713.0'
+        values = values.str.replace(r"\.0$", "", regex=True)
+        return values[values != ""]
+
+    @staticmethod
+    def classify_column(series, sample_size=SAMPLE_SIZE, min_share=MIN_MATCH_SHARE):
+        """Return the content type of a column ('Phone', 'Email', 'Zip', 'Name') or None."""
+        values = ColumnProfiler.sample_column(series, sample_size)
+        if values.empty:
+            return None
+        for content_type, pattern in ColumnProfiler.PATTERNS:
+            if values.str.match(pattern).mean() < min_share:
+                continue
+            if values.nunique() < ColumnProfiler.MIN_DISTINCT_SHARE.get(content_type, 0) * len(values):
+                continue
+            return content_type
+        return None
+
+    @staticmethod
+    def profile_columns(data, columns=None, sample_size=SAMPLE_SIZE):
+        """Classify each of the given columns (all columns by default) from a bounded sample."""
+        columns = data.columns if columns is None else columns
+        return {col: ColumnProfiler.classify_column(data[col], sample_size) for col in columns}
+
+    @staticmethod
+    def infer_column_names(data, sample_size=SAMPLE_SIZE):
+        """Build a rename mapping for unlabeled columns whose content type could be inferred."""
+        unlabeled = [col for col in data.columns if ColumnProfiler.is_unlabeled(col)]
+        profile = ColumnProfiler.profile_columns(data, unlabeled, sample_size)
+
+        taken = {str(col) for col in data.columns}
+        mapping = {}
+        for col in unlabeled:
+            content_type = profile[col]
+            if content_type is None:
+                continue
+            # Names are split into first and last when those headers are still free
+            candidates = ["First Name", "Last Name"] if content_type == "Name" else [content_type]
+            name = next((c for c in candidates if c not in taken), None)
+            suffix = 2
+            while name is None:
+                if f"{content_type} {suffix}" not in taken:
+                    name = f"{content_type} {suffix}"
+                suffix += 1
+            taken.add(name)
+            mapping[col] = name
+        return mapping
+
+    @staticmethod
+    def map_unlabeled_columns(data, sample_size=SAMPLE_SIZE):
+        """Rename unlabeled columns after their inferred content so header matching can find them."""
+        mapping = ColumnProfiler.infer_column_names(data, sample_size)
+        return data.rename(columns=mapping) if mapping else data
@@ -0,0 +1,141 @@
+import numpy as np
+import pandas as pd
+
+
+class ContactSets:
+    """Swap-insensitive matching of multi-slot contact fields (Phone 1..N, Email 1..N)."""
+
+    # exact: same set of values; subset: one row's values contain the other's; overlap: any value shared
+    MODES = ("exact", "subset", "overlap")
+
+    @staticmethod
+    def as_text(series):
+        """Render a column as stripped text with '' for missing values and no float '.0' artifacts."""
+        text = series.astype("string").fillna("").str.strip()
+        return text.str.replace(r"\.0$", "", regex=True).astype(object)
+
+    @staticmethod
+    def hash_slots(data, columns):
+        """Hash each row's values into a sorted fixed-width uint64 array; 0 marks an empty slot."""
+        if not columns:
+            return np.zeros((len(data), 0), dtype=np.uint64)
+        slots = np.empty((len(data), len(columns)), dtype=np.uint64)
+        for position, col in enumerate(columns):
+            text = ContactSets.as_text(data[col])
+            slots[:, position] = pd.util.hash_array(text.to_numpy(dtype=object))
+            slots[(text == "").to_numpy(), position] = 0
+        slots.sort(axis=1)
+        # The same value in two slots (Phone == Alt. Phone) counts once
+        repeated = np.zeros(slots.shape, dtype=bool)
+        repeated[:, 1:] = slots[:, 1:] == slots[:, :-1]
+        slots[repeated] = 0
+        slots.sort(axis=1)
+        return slots
+
+    @staticmethod
+    def set_keys(slots):
+        """One 64-bit key per row identifying its value set, independent of slot order."""
+        if slots.shape[1] == 0:
+            return np.zeros(len(slots), dtype=np.uint64)
+        return pd.util.hash_pandas_object(pd.DataFrame(slots), index=False).to_numpy()
+
+    @staticmethod
+    def group_ids(data, columns):
+        """Number the rows by the combination of values they hold in the exact-match columns."""
+        if not columns:
+            return np.zeros(len(data), dtype=np.int64)
+        text = pd.DataFrame({col: ContactSets.as_text(data[col]) for col in columns})
+        return text.groupby(list(columns), sort=False).ngroup().to_numpy(dtype=np.int64)
+
+    @staticmethod
+    def shared_value_pairs(groups, slots):
+        """Count the values shared by every pair of rows (i < j) in the same group, via a value index."""
+        rows, cols = np.nonzero(slots)
+        values = pd.DataFrame({"group": groups[rows], "value": slots[rows, cols], "row": rows})
+        pairs = values.merge(values, on=["group", "value"], suffixes=("_i", "_j"))
+        pairs = pairs[pairs["row_i"] < pairs["row_j"]]
+        return pairs.groupby(["row_i", "row_j"], sort=False).size().rename("shared").reset_index()
+
+    @staticmethod
+    def find_matches(data, group_columns, contact_columns, mode="subset", progress=None):
+        """Find rows that duplicate an earlier row.
+
+        Rows must agree exactly on group_columns. For every contact type in contact_columns
+        ({"phone": [...], "email": [...]}) their value sets must match under mode, with an empty
+        set matching anything except in exact mode. Returns one row per duplicate with the
+        position of the earliest row it matches and the rule that linked them. A ProgressReporter
+        passed as progress counts the comparison passes under the "compare" stage.
+        """
+        if mode not in ContactSets.MODES:
+            raise ValueError(f"Unknown matching mode: {mode}")
+
+        n = len(data)
+        groups = ContactSets.group_ids(data, group_columns)
+        types = [t for t, cols in contact_columns.items() if cols]
+        slots = {t: ContactSets.hash_slots(data, contact_columns[t]) for t in types}
+        empty = {t: ~slots[t].any(axis=1) for t in types}
+        if progress:
+            # One pass per contact type over shared values, one per empty-type combination
+            progress.start("compare", 1 if mode == "exact" else len(types) + (1 << len(types)))
+
+        if mode == "exact":
+            keys = [pd.Series(groups)] + [pd.Series(ContactSets.set_keys(slots[t])) for t in types]
+            match = pd.Series(np.arange(n)).groupby(keys, sort=False).transform("min").to_numpy()
+            duplicates = np.flatnonzero(match != np.arange(n))
+            if progress:
+                progress.finish("compare")
+            rule = "+".join(f"{t}:exact" for t in types) or "fields"
+            return pd.DataFrame({"row": duplicates, "match": match[duplicates], "rule": rule})
+
+        candidates = []
+
+        # Pairs sharing at least one value in some contact type: check every type for them
+        related = {}
+        for t in types:
+            pairs = ContactSets.shared_value_pairs(groups, slots[t])
+            sizes = (slots[t] != 0).sum(axis=1)
+            if mode == "subset":
+                keep = (pairs["shared"].to_numpy() == sizes[pairs["row_i"]]) | \
+                       (pairs["shared"].to_numpy() == sizes[pairs["row_j"]])
+                pairs = pairs[keep]
+            related[t] = pairs[["row_i", "row_j"]].assign(**{t: True})
+            if progress:
+                progress.advance("compare")
+
+        if types:
+            pairs = pd.concat([r[["row_i", "row_j"]] for r in related.values()]).drop_duplicates()
+            ok = np.ones(len(pairs), dtype=bool)
+            rules = None
+            for t in types:
+                hit = pairs.merge(related[t], on=["row_i", "row_j"], how="left")[t].notna().to_numpy()
+                missing = empty[t][pairs["row_i"].to_numpy()] | empty[t][pairs["row_j"].to_numpy()]
+                ok &= hit | missing
+                label = np.where(hit, f"{t}:{mode}", f"{t}:missing").astype(object)
+                rules = label if rules is None else rules + "+" + label
+            pairs = pairs.assign(rule=rules)[ok]
+            candidates.append(pairs.rename(columns={"row_i": "match", "row_j": "row"}))
+
+        # Pairs where each contact type is empty on one side or the other match without sharing a value
+        empty_mask = np.zeros(n, dtype=np.int64)
+        for bit, t in enumerate(types):
+            empty_mask |= empty[t].astype(np.int64) << bit
+        full = (1 << len(types)) - 1
+        rows = pd.DataFrame({"group": groups, "mask": empty_mask, "row": np.arange(n)})
+        firsts = rows.groupby(["group", "mask"], sort=False)["row"].min().reset_index()
+        for mask in range(full + 1):
+            # An earlier row with empty mask `mask` covers rows empty in every other type
+            needed = full & ~mask
+            covered = rows[(rows["mask"] & needed) == needed]
+            earliest = firsts[firsts["mask"] == mask][["group", "row"]].rename(columns={"row": "match"})
+            pairs = covered.merge(earliest, on="group")
+            pairs = pairs[pairs["match"] < pairs["row"]]
+            rule = "+".join(f"{t}:missing" for t in types) or "fields"
+            candidates.append(pairs[["match", "row"]].assign(rule=rule))
+            if progress:
+                progress.advance("compare")
+
+        matches = pd.concat(candidates, ignore_index=True)
+        matches = matches.sort_values(["row", "match"], kind="stable").drop_duplicates("row")
+        if progress:
+            progress.finish("compare")
+        return matches[["row", "match", "rule"]].reset_index(drop=True)
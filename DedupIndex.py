@@ -0,0 +1,227 @@
+import hashlib
+import os
+import sqlite3
+import time
+import uuid
+
+import numpy as np
+import pandas as pd
+
+from BloomFilter import BloomFilter
+from ContactSets import ContactSets
+
+
+class DedupIndex:
+    """Persistent SQLite index of normalized contact and address keys seen in earlier runs."""
+
+    KINDS = {"phone": 0, "email": 1, "address": 2}
+    # Contact keys decide whether a row was already handled; rows without any fall back to the address
+    CONTACT_KINDS = (KINDS["phone"], KINDS["email"])
+
+    # The Bloom filter is sized for twice the stored keys, never less than this
+    MIN_BLOOM_CAPACITY = 1_000_000
+    DEFAULT_FP_RATE = 0.001
+
+    SCHEMA = """
+        CREATE TABLE IF NOT EXISTS keys (
+            kind INTEGER NOT NULL,
+            key INTEGER NOT NULL,
+            source TEXT,
+            source_row INTEGER,
+            batch TEXT,
+            PRIMARY KEY (kind, key)
+        ) WITHOUT ROWID;
+        CREATE TABLE IF NOT EXISTS batches (
+            batch TEXT PRIMARY KEY,
+            created REAL NOT NULL,
+            rows INTEGER NOT NULL,
+            sources TEXT
+        );
+        CREATE TABLE IF NOT EXISTS files (
+            digest TEXT PRIMARY KEY,
+            name TEXT,
+            batch TEXT
+        );
+        CREATE TABLE IF NOT EXISTS meta (
+            name TEXT PRIMARY KEY,
+            value INTEGER NOT NULL
+        );
+        INSERT OR IGNORE INTO meta (name, value) SELECT 'keys', COUNT(*) FROM keys;
+    """
+
+    def __init__(self, path, fp_rate=DEFAULT_FP_RATE):
+        self.path = path
+        folder = os.path.dirname(os.path.abspath(path))
+        if not os.path.exists(folder):
+            os.makedirs(folder)
+        self.connection = sqlite3.connect(path)
+        self.connection.execute("PRAGMA journal_mode=WAL")
+        self.connection.execute("PRAGMA synchronous=NORMAL")
+        self.connection.executescript(DedupIndex.SCHEMA)
+        # Pre-screen for lookups: most new rows are new, and the filter rules them out without SQLite
+        self.bloom = self.open_bloom(fp_rate)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+    def close(self):
+        self.bloom.close()
+        self.connection.close()
+
+    def open_bloom(self, fp_rate):
+        """Map the filter file next to the index, rebuilding it when it is stale, too small or retuned."""
+        bloom_path = self.path + ".bloom"
+        count = self.count()
+        capacity = max(2 * count, DedupIndex.MIN_BLOOM_CAPACITY)
+        bloom = BloomFilter(bloom_path, capacity, fp_rate)
+        if bloom.synced < count or bloom.capacity < count or bloom.fp_rate != fp_rate:
+            bloom.close()
+            os.remove(bloom_path)
+            bloom = BloomFilter(bloom_path, capacity, fp_rate)
+            cursor = self.connection.execute("SELECT kind, key FROM keys")
+            for rows in iter(lambda: cursor.fetchmany(500_000), []):
+                bloom.add(DedupIndex.bloom_keys(pd.DataFrame(rows, columns=["kind", "key"])))
+            bloom.flush(count)
+        return bloom
+
+    @staticmethod
+    def bloom_keys(keys):
+        """Fold the key kind into the 64-bit key so a phone and an email hash never collide."""
+        kind = keys["kind"].to_numpy(dtype=np.uint64)
+        with np.errstate(over="ignore"):
+            return keys["key"].to_numpy(dtype=np.int64).view(np.uint64) ^ (kind * np.uint64(0x9E3779B97F4A7C15))
+
+    @staticmethod
+    def new_batch_id():
+        return time.strftime("%Y%m%d-%H%M%S-") + uuid.uuid4().hex[:8]
+
+    @staticmethod
+    def file_digest(path, chunk_size=1 << 20):
+        """Content hash of an input file, so a re-selected export is recognized under any name."""
+        digest = hashlib.sha1()
+        with open(path, "rb") as handle:
+            for chunk in iter(lambda: handle.read(chunk_size), b""):
+                digest.update(chunk)
+        return digest.hexdigest()
+
+    @staticmethod
+    def normalize_phones(text):
+        """Digits only, keeping the last 10 so '1-520-409-0329' and '5204090329' share a key."""
+        return text.str.replace(r"\D", "", regex=True).str[-10:]
+
+    @staticmethod
+    def hash_keys(values):
+        """64-bit keys stored as signed integers, which is what SQLite holds natively."""
+        return pd.util.hash_array(np.asarray(values, dtype=object)).view(np.int64)
+
+    @staticmethod
+    def extract_keys(data, contact_columns, address_columns=("Address", "Zip")):
+        """Long table of (row, kind, key) for every non-empty phone, email and address key of data."""
+        frames = []
+        for kind, columns in contact_columns.items():
+            for col in columns:
+                text = ContactSets.as_text(data[col]).str.lower()
+                if kind == "phone":
+                    text = DedupIndex.normalize_phones(text)
+                present = (text != "").to_numpy()
+                frames.append(pd.DataFrame({
+                    "row": np.flatnonzero(present),
+                    "kind": DedupIndex.KINDS[kind],
+                    "key": DedupIndex.hash_keys(text.to_numpy(dtype=object)[present]),
+                }))
+
+        address_columns = [col for col in address_columns if col in data.columns]
+        if address_columns:
+            parts = [ContactSets.as_text(data[col]).str.lower().str.replace(r"[^\w]", "", regex=True)
+                     for col in address_columns]
+            present = (parts[0] != "").to_numpy()
+            text = parts[0].str.cat(parts[1:], sep="|") if len(parts) > 1 else parts[0]
+            frames.append(pd.DataFrame({
+                "row": np.flatnonzero(present),
+                "kind": DedupIndex.KINDS["address"],
+                "key": DedupIndex.hash_keys(text.to_numpy(dtype=object)[present]),
+            }))
+
+        if not frames:
+            return pd.DataFrame({"row": [], "kind": [], "key": []}, dtype=np.int64)
+        return pd.concat(frames, ignore_index=True).drop_duplicates(["row", "kind", "key"])
+
+    def lookup(self, keys):
+        """Bulk-probe (kind, key) pairs; returns the matching ones with the lineage stored for them."""
+        unique = keys[["kind", "key"]].drop_duplicates()
+        # Only keys the Bloom filter cannot rule out need the exact probe
+        unique = unique[self.bloom.contains(DedupIndex.bloom_keys(unique))]
+        if unique.empty:
+            return pd.DataFrame({"kind": pd.Series(dtype=np.int64), "key": pd.Series(dtype=np.int64),
+                                 "source": pd.Series(dtype=object), "source_row": pd.Series(dtype=np.int64),
+                                 "batch": pd.Series(dtype=object)})
+        with self.connection:
+            self.connection.execute("CREATE TEMP TABLE IF NOT EXISTS probe (kind INTEGER, key INTEGER)")
+            self.connection.execute("DELETE FROM probe")
+            self.connection.executemany("INSERT INTO probe VALUES (?, ?)",
+                                        unique.itertuples(index=False, name=None))
+            hits = pd.read_sql_query(
+                "SELECT k.kind, k.key, k.source, k.source_row, k.batch "
+                "FROM probe p JOIN keys k ON k.kind = p.kind AND k.key = p.key",
+                self.connection)
+            self.connection.execute("DELETE FROM probe")
+        return hits.astype({"kind": np.int64, "key": np.int64})
+
+    def find_seen(self, keys, rows):
+        """Per-row matches against the index: one (row, kind, key, source, source_row, batch) per hit.
+
+        A row counts as seen when any of its contact keys was seen, or, for rows with no contact
+        keys at all, when its address key was.
+        """
+        hits = keys.merge(self.lookup(keys), on=["kind", "key"])
+        has_contact = np.zeros(rows, dtype=bool)
+        contact = keys["kind"].isin(DedupIndex.CONTACT_KINDS)
+        has_contact[keys.loc[contact, "row"].to_numpy()] = True
+        decisive = hits["kind"].isin(DedupIndex.CONTACT_KINDS).to_numpy() | ~has_contact[hits["row"].to_numpy()]
+        return hits[decisive].sort_values(["row", "kind"]).reset_index(drop=True)
+
+    def known_files(self, digests):
+        """The subset of file digests already ingested by an earlier batch."""
+        known = set()
+        for digest in digests:
+            if self.connection.execute("SELECT 1 FROM files WHERE digest = ?", (digest,)).fetchone():
+                known.add(digest)
+        return known
+
+    def add(self, keys, lineage, sources=(), batch=None, files=()):
+        """Record keys with their lineage (a frame of source, source_row per row); first sighting wins.
+
+        Keys, the batch entry and the ingested (digest, name) files are committed in one
+        transaction, so an interrupted run leaves the index as it was.
+        """
+        batch = batch or DedupIndex.new_batch_id()
+        records = keys.join(lineage.reset_index(drop=True), on="row")
+
+        # The filter is flushed before the commit: a crash in between only costs false positives
+        self.bloom.add(DedupIndex.bloom_keys(records))
+        self.bloom.flush()
+        with self.connection:
+            inserted = self.connection.executemany(
+                "INSERT OR IGNORE INTO keys (kind, key, source, source_row, batch) VALUES (?, ?, ?, ?, ?)",
+                ((int(kind), int(key), source, int(source_row), batch) for kind, key, source, source_row
+                 in records[["kind", "key", "source", "source_row"]].itertuples(index=False, name=None))).rowcount
+            self.connection.execute("UPDATE meta SET value = value + ? WHERE name = 'keys'", (inserted,))
+            self.connection.execute("INSERT INTO batches (batch, created, rows, sources) VALUES (?, ?, ?, ?)",
+                                    (batch, time.time(), len(lineage), "\n".join(sources)))
+            self.connection.executemany("INSERT OR IGNORE INTO files (digest, name, batch) VALUES (?, ?, ?)",
+                                        ((digest, name, batch) for digest, name in files))
+
+        count = self.count()
+        if count > self.bloom.capacity:
+            # Past its capacity the false-positive rate climbs; rebuild at twice the size
+            self.bloom.close()
+            self.bloom = self.open_bloom(self.bloom.fp_rate)
+        else:
+            self.bloom.flush(count)
+        return batch
+
+    def count(self):
+        return self.connection.execute("SELECT value FROM meta WHERE name = 'keys'").fetchone()[0]
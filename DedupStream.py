@@ -0,0 +1,295 @@
+import os
+from collections import namedtuple
+
+import numpy as np
+import pandas as pd
+
+from ColumnProfiler import ColumnProfiler
+from ContactSets import ContactSets
+from DedupIndex import DedupIndex
+from Processor import DataProcessor
+
+# What happened to one input row; cluster_id is the id output_clusters uses for the same survivor
+Decision = namedtuple("Decision", ["record", "source", "source_row", "cluster_id", "survivor", "rule"])
+# Per row: group hash, contact value hashes per kind, bit per kind left empty, and the hash of all of them
+RowKeys = namedtuple("RowKeys", ["groups", "slots", "empty_mask", "signatures"])
+
+
+class DedupStream:
+    """Lazy deduplication for embedding in other tools: records or files in, surviving records out.
+
+    Rows are matched as DataProcessor.run matches them (ContactSets.find_matches on the fields
+    common to the inputs, under match_mode), one chunk at a time. Earlier rows are kept as match
+    targets only once per distinct signature (group values plus contact sets), so memory follows
+    the distinct signatures seen, not the size of the input. With index_path, survivors are also
+    checked against earlier runs and added to the index, as run() does.
+
+    Each chunk is matched only against the stored rows it could match: those sharing a group and a
+    contact value with one of its rows, the first stored row of each group and empty mask (rows
+    lacking a contact kind match anything in it), or in exact mode those with the same signature.
+
+    The common fields are those of the inputs seen so far, so a later input lacking a field loosens
+    matching from then on; a decision is final once yielded.
+    """
+
+    CHUNK_ROWS = DataProcessor.CHUNK_ROWS
+
+    def __init__(self, match_mode="subset", index_path=None, chunk_rows=CHUNK_ROWS):
+        if match_mode not in ContactSets.MODES:
+            raise ValueError(f"Unknown matching mode: {match_mode}")
+        self.match_mode = match_mode
+        self.chunk_rows = chunk_rows
+        self.index = DedupIndex(index_path) if index_path else None
+        # Index batches written by this stream; only earlier runs' keys count as history
+        self.batches = set()
+        # Every column seen, in order of appearance, and those every source so far has
+        self.columns = []
+        self.common = None
+        # Match targets: frames of earlier rows with their cluster ids, numbered across frames in input order
+        self.store = []
+        self.stored = 0
+        # (group columns, contact columns, mode) the lookups below were built for
+        self.layout = None
+        # Signature -> first stored row; (group, empty mask) -> first stored row; value key -> stored rows
+        self.signatures = {}
+        self.first_rows = {}
+        self.value_rows = {}
+
+    def close(self):
+        if self.index:
+            self.index.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+    @staticmethod
+    def deduplicate(sources, clusters=False, match_mode="subset", index_path=None, chunk_rows=CHUNK_ROWS):
+        """Yield the surviving records of sources, or with clusters=True a Decision for every row.
+
+        sources is an iterable of file paths (.csv is read chunk by chunk) and records (mappings),
+        in any mix; records come back as the same objects, file rows as dicts of their values.
+        """
+        with DedupStream(match_mode, index_path, chunk_rows) as stream:
+            for decision in stream.decide(sources):
+                if clusters:
+                    yield decision
+                elif decision.survivor:
+                    yield decision.record
+
+    def add_source(self, columns):
+        """Account for one more input's columns."""
+        columns = [col for col in columns if col not in DataProcessor.SOURCE_COLUMNS]
+        self.columns.extend(col for col in columns if col not in self.columns)
+        self.common = set(columns) if self.common is None else self.common & set(columns)
+
+    def chunks(self, sources):
+        """(frame, records or None, source name, first row number) per chunk, reading files lazily.
+
+        Frames have their unlabeled columns named already; a file is profiled on its first chunk,
+        so all its chunks get the same names.
+        """
+        records, record_start = [], 0
+
+        def record_chunk():
+            frame = ColumnProfiler.map_unlabeled_columns(pd.DataFrame.from_records(records))
+            self.add_source(frame.columns)
+            return frame, records, "records", record_start
+
+        for item in sources:
+            if isinstance(item, (str, os.PathLike)):
+                if records:
+                    yield record_chunk()
+                    record_start += len(records)
+                    records = []
+                path = os.fspath(item)
+                if path.endswith(".csv"):
+                    frames = pd.read_csv(path, chunksize=self.chunk_rows)
+                else:
+                    frames = DataProcessor.iter_chunks(DataProcessor.load_data(path), self.chunk_rows)
+                start, mapping = 0, None
+                for frame in frames:
+                    if mapping is None:
+                        mapping = ColumnProfiler.infer_column_names(frame)
+                        self.add_source(frame.rename(columns=mapping).columns)
+                    yield frame.rename(columns=mapping).reset_index(drop=True), None, os.path.basename(path), start
+                    start += len(frame)
+            else:
+                records.append(item)
+                if len(records) == self.chunk_rows:
+                    yield record_chunk()
+                    record_start += len(records)
+                    records = []
+        if records:
+            yield record_chunk()
+
+    @staticmethod
+    def cluster_ids(labels):
+        """Stable cluster ids of survivors from their 'file|row' labels, like DataProcessor.duplicate_clusters."""
+        labels = np.asarray(labels, dtype=object)
+        return pd.util.hash_array(labels).view(np.int64) if len(labels) else np.empty(0, dtype=np.int64)
+
+    @staticmethod
+    def group_hashes(data, group_columns):
+        """Hash of each row's text in the group columns; a column the frame lacks reads as empty."""
+        if not group_columns:
+            return np.zeros(len(data), dtype=np.uint64)
+        data = data.reindex(columns=group_columns)
+        text = pd.DataFrame({col: ContactSets.as_text(data[col]) for col in group_columns}, index=data.index)
+        return pd.util.hash_pandas_object(text, index=False).to_numpy()
+
+    def matching_setup(self):
+        """(group columns, contact columns, mode) for the inputs so far, as DataProcessor.find_duplicates picks them."""
+        common = self.common & set(DataProcessor.output_columns(self.columns))
+        if not common:
+            # Without shared fields only fully identical rows are duplicates
+            return list(self.columns), {}, "exact"
+        contact_columns = DataProcessor.find_contact_columns(self.columns)
+        group_columns = sorted(common - set(contact_columns["phone"]) - set(contact_columns["email"]))
+        return group_columns, contact_columns, self.match_mode
+
+    def row_keys(self, data):
+        """RowKeys of data's rows under the current layout."""
+        group_columns, contact_columns, _ = self.layout
+        groups = DedupStream.group_hashes(data, group_columns)
+        slots = {kind: ContactSets.hash_slots(data.reindex(columns=columns), columns)
+                 for kind, columns in contact_columns.items() if columns}
+        # Bits in find_matches' order of the contact kinds
+        empty_mask = np.zeros(len(data), dtype=np.int64)
+        for bit, kind_slots in enumerate(slots.values()):
+            empty_mask |= (~kind_slots.any(axis=1)).astype(np.int64) << bit
+        parts = {"group": groups, **{kind: ContactSets.set_keys(kind_slots) for kind, kind_slots in slots.items()}}
+        signatures = pd.util.hash_pandas_object(pd.DataFrame(parts), index=False).to_numpy()
+        return RowKeys(groups, slots, empty_mask, signatures)
+
+    @staticmethod
+    def value_keys(keys):
+        """(key, row) for every contact value of every row; the key tells group, kind and value apart."""
+        values, rows = [np.empty(0, dtype=np.uint64)], [np.empty(0, dtype=np.int64)]
+        for bit, kind_slots in enumerate(keys.slots.values()):
+            row, slot = np.nonzero(kind_slots)
+            parts = pd.DataFrame({"group": keys.groups[row], "kind": np.full(len(row), bit),
+                                  "value": kind_slots[row, slot]})
+            values.append(pd.util.hash_pandas_object(parts, index=False).to_numpy())
+            rows.append(row)
+        return np.concatenate(values), np.concatenate(rows)
+
+    def index_rows(self, keys, start):
+        """Add stored rows numbered from start to the lookups."""
+        positions = range(start, start + len(keys.groups))
+        for signature, position in zip(keys.signatures.tolist(), positions):
+            self.signatures.setdefault(signature, position)
+        if self.layout[2] == "exact":
+            return
+        for key, position in zip(zip(keys.groups.tolist(), keys.empty_mask.tolist()), positions):
+            self.first_rows.setdefault(key, position)
+        values, rows = DedupStream.value_keys(keys)
+        for value, position in zip(values.tolist(), (start + rows).tolist()):
+            self.value_rows.setdefault(value, []).append(position)
+
+    def set_layout(self, layout):
+        """Match under layout from now on; a changed one (the common fields shrank) re-keys the stored rows."""
+        if layout == self.layout:
+            return
+        self.layout = layout
+        self.signatures, self.first_rows, self.value_rows = {}, {}, {}
+        start = 0
+        for frame in self.store:
+            self.index_rows(self.row_keys(frame), start)
+            start += len(frame)
+
+    def candidates(self, keys):
+        """Stored rows any row with these keys could match, in input order."""
+        if self.layout[2] == "exact":
+            found = (self.signatures.get(signature) for signature in np.unique(keys.signatures).tolist())
+            positions = [position for position in found if position is not None]
+        else:
+            values, _ = DedupStream.value_keys(keys)
+            positions = [position for value in np.unique(values).tolist()
+                         for position in self.value_rows.get(value, ())]
+            masks = range(1 << len(keys.slots))
+            firsts = (self.first_rows.get((group, mask)) for group in np.unique(keys.groups).tolist() for mask in masks)
+            positions.extend(position for position in firsts if position is not None)
+        positions = np.unique(np.array(positions, dtype=np.int64))
+
+        starts = np.cumsum([0] + [len(frame) for frame in self.store])
+        cuts = np.searchsorted(positions, starts)
+        frames = [frame.iloc[positions[low:high] - start]
+                  for frame, start, low, high in zip(self.store, starts, cuts[:-1], cuts[1:]) if high > low]
+        return pd.concat(frames, ignore_index=True) if frames else pd.DataFrame({"_cluster": []}, dtype=np.int64)
+
+    def remember(self, data, keys, cluster):
+        """Keep the chunk's rows with a signature not stored yet as match targets for later chunks."""
+        signatures = keys.signatures
+        new = ~pd.Series(signatures).duplicated().to_numpy()
+        new &= np.array([signature not in self.signatures for signature in signatures.tolist()], dtype=bool)
+        if new.any():
+            self.index_rows(RowKeys(keys.groups[new], {kind: slots[new] for kind, slots in keys.slots.items()},
+                                    keys.empty_mask[new], signatures[new]), self.stored)
+            self.store.append(data[new].assign(_cluster=cluster[new]).reset_index(drop=True))
+            self.stored += int(new.sum())
+
+    def check_history(self, data, survivor, base, rule, source, start):
+        """Drop survivors an earlier run already had (find_seen, as split_seen does) and index the rest."""
+        positions = np.flatnonzero(survivor)
+        kept = data.iloc[positions].reset_index(drop=True)
+        keys = DedupIndex.extract_keys(kept, DataProcessor.find_contact_columns(kept.columns))
+        seen = self.index.find_seen(keys, len(kept))
+        seen = seen[~seen["batch"].isin(self.batches)].drop_duplicates("row")
+        rows = positions[seen["row"].to_numpy()]
+        survivor[rows] = False
+        base[rows] = DedupStream.cluster_ids(seen["source"].astype(str) + "|" + seen["source_row"].astype(str))
+        kinds = {code: kind for kind, code in DedupIndex.KINDS.items()}
+        rule[rows] = ("history:" + seen["kind"].map(kinds)).to_numpy()
+
+        keep = np.ones(len(kept), dtype=bool)
+        keep[seen["row"].to_numpy()] = False
+        lineage = pd.DataFrame({"source": source, "source_row": start + positions[keep]})
+        self.batches.add(self.index.add(DataProcessor.kept_keys(keys, keep), lineage, [source]))
+
+    def decide_chunk(self, frame, source, start):
+        """Survivor flag, cluster id and rule for each row of one chunk."""
+        normalized = DataProcessor.preprocess_data(frame.copy())
+        n = len(normalized)
+        self.set_layout(self.matching_setup())
+        group_columns, contact_columns, mode = self.layout
+        columns = list(dict.fromkeys(group_columns + [col for cols in contact_columns.values() for col in cols]))
+        data = normalized.reindex(columns=columns)
+        keys = self.row_keys(data)
+
+        # Matched together with the stored rows it could match, which come first as the earlier rows
+        earlier = self.candidates(keys)
+        offset = len(earlier)
+        combined = pd.concat([earlier.reindex(columns=columns), data], ignore_index=True)
+        matches = ContactSets.find_matches(combined, group_columns, contact_columns, mode)
+        matches = matches[matches["row"].to_numpy() >= offset]
+        rows = matches["row"].to_numpy() - offset
+        match = matches["match"].to_numpy()
+        in_chunk = match >= offset
+
+        # Chains inside the chunk collapse onto their root; a root matching a stored row takes its cluster
+        parent = DataProcessor.match_roots(n, rows[in_chunk], match[in_chunk] - offset)
+        base = DedupStream.cluster_ids([f"{source}|{row}" for row in range(start, start + n)])
+        base[rows[~in_chunk]] = earlier["_cluster"].to_numpy(dtype=np.int64)[match[~in_chunk]]
+        survivor = np.ones(n, dtype=bool)
+        survivor[rows] = False
+        rule = np.full(n, "", dtype=object)
+        rule[rows] = matches["rule"].to_numpy()
+
+        if self.index:
+            self.check_history(normalized, survivor, base, rule, source, start)
+        cluster = base[parent]
+        self.remember(data, keys, cluster)
+        return survivor, cluster, rule
+
+    def decide(self, sources):
+        """Decision per input row, in input order, one chunk at a time."""
+        for frame, records, source, start in self.chunks(sources):
+            survivor, cluster, rule = self.decide_chunk(frame, source, start)
+            if records is None:
+                records = frame.astype(object).where(frame.notna(), None).to_dict("records")
+            for position, record in enumerate(records):
+                yield Decision(record, source, start + position, int(cluster[position]), bool(survivor[position]),
+                               rule[position])
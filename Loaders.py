@@ -0,0 +1,74 @@
+import importlib
+import threading
+import time
+
+
+class ModuleLoader:
+    """Import heavy modules on first use, keyed by input extension, and time each import."""
+
+    # What reading an input extension needs; "pipeline" is the processor itself, which brings in
+    # the writers and their libraries (xlsxwriter, reportlab, pyarrow) with it
+    REGISTRY = {
+        "pipeline": ("pandas", "Processor"),
+        ".csv": ("pandas",),
+        ".xlsx": ("pandas", "openpyxl"),
+        ".pdf": ("pandas", "tabula"),
+    }
+    # pip package of a module, where the two names differ
+    PACKAGES = {"tabula": "tabula-py"}
+
+    # module name -> module, or None when it is not installed; and the seconds its first import took
+    modules = {}
+    timings = {}
+    _lock = threading.Lock()
+
+    @staticmethod
+    def module(name):
+        """Import a module once and return it; the warm-up thread and callers share the same import."""
+        with ModuleLoader._lock:
+            if name not in ModuleLoader.modules:
+                started = time.perf_counter()
+                try:
+                    ModuleLoader.modules[name] = importlib.import_module(name)
+                except ImportError:
+                    # Optional dependencies (pypdf, pyarrow) may be missing; their callers fall back
+                    ModuleLoader.modules[name] = None
+                ModuleLoader.timings[name] = time.perf_counter() - started
+            return ModuleLoader.modules[name]
+
+    @staticmethod
+    def require(name, purpose):
+        """Like module(), but a missing module is an error naming what needs it and what to install."""
+        module = ModuleLoader.module(name)
+        if module is None:
+            package = ModuleLoader.PACKAGES.get(name, name)
+            raise ValueError(f"{purpose} needs the {package} package (pip install {package})")
+        return module
+
+    @staticmethod
+    def load(key):
+        """Import everything the registry lists for an extension."""
+        for name in ModuleLoader.REGISTRY.get(key, ()):
+            ModuleLoader.module(name)
+
+    @staticmethod
+    def warm_up(keys=None, on_done=None):
+        """Import the given registry keys (all of them by default) in a daemon thread; returns the thread."""
+        keys = list(ModuleLoader.REGISTRY) if keys is None else list(keys)
+
+        def load_all():
+            for key in keys:
+                ModuleLoader.load(key)
+            if on_done:
+                on_done()
+
+        thread = threading.Thread(target=load_all, daemon=True)
+        thread.start()
+        return thread
+
+    @staticmethod
+    def report():
+        """Import times in milliseconds, slowest first."""
+        lines = [f"{name}: {seconds * 1000:.0f} ms" for name, seconds in
+                 sorted(ModuleLoader.timings.items(), key=lambda item: -item[1])]
+        return "\n".join(lines)
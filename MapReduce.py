@@ -0,0 +1,284 @@
+import os
+import shutil
+import uuid
+from collections import deque
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, wait
+
+import numpy as np
+import pandas as pd
+
+from ContactSets import ContactSets
+from Processor import ChunkSource, DataProcessor, ProcessingResult
+from Progress import ProgressReporter
+from Suppression import SuppressionList
+
+
+class MapReduce:
+    """Hash-partitioned deduplication: map rows to N partitions on disk, dedup each on its own worker, merge.
+
+    Rows are only ever compared with rows holding the same values in the group columns (or, without
+    common columns, identical rows), so hashing those values picks a partition that holds every
+    possible match of a row, and the merged result is the one DataProcessor.run gives.
+
+    Every task is a static method taking and returning plain paths and frames, so any
+    concurrent.futures executor runs them: local processes by default, or one whose workers live on
+    other hosts, with work_dir on storage they all share.
+    """
+
+    # Sort order of the survivor and cluster shards, and of the merged outputs
+    SURVIVOR_ORDER = ["_file_number", "_source_row"]
+    CLUSTER_ORDER = ["cluster_id", "member_file", "member_row"]
+
+    @staticmethod
+    def normalize_file(file_path, number, work_dir):
+        """Map, first pass: normalize one input file to disk; returns its column names in order."""
+        data = DataProcessor.load_normalized(file_path)
+        data.to_pickle(os.path.join(work_dir, "normalized", f"{number:05d}.pkl"))
+        return list(data.columns)
+
+    @staticmethod
+    def block_partitions(data, block_columns, partitions):
+        """Partition number of every row, from a hash of its text in the blocking columns."""
+        if not block_columns:
+            # Only contact columns are shared: every row may match every other, so all stay together
+            return np.zeros(len(data), dtype=np.int64)
+        # A column missing from this file reads as empty, as it does in the combined frame
+        text = pd.DataFrame({col: ContactSets.as_text(data[col]) if col in data.columns
+                             else pd.Series("", index=data.index, dtype=object) for col in block_columns})
+        return (pd.util.hash_pandas_object(text, index=False).to_numpy() % np.uint64(partitions)).astype(np.int64)
+
+    @staticmethod
+    def partition_warnings(block_columns, partitions, used):
+        """Say so when the rows could not be spread over the partitions, so one worker did all the comparing."""
+        if partitions <= 1 or used > 1:
+            return []
+        if not block_columns:
+            return ["The inputs share no field besides phones and emails to partition on, so all rows were "
+                    "deduplicated in one partition by one worker"]
+        return [f"All rows have the same {', '.join(block_columns)}, so they were deduplicated in one partition "
+                f"by one worker"]
+
+    @staticmethod
+    def map_file(number, work_dir, block_columns, partitions, suppression_paths=(), suppressed_statuses=()):
+        """Map, second pass: drop suppressed rows and split one normalized file into partition shards.
+
+        Shards are named after the file number, so a partition read in name order keeps input order.
+        Returns the file's (rows loaded, rows suppressed).
+        """
+        data = pd.read_pickle(os.path.join(work_dir, "normalized", f"{number:05d}.pkl"))
+        rows_loaded = len(data)
+        if suppression_paths or suppressed_statuses:
+            suppressed = SuppressionList.suppressed_rows(
+                data, DataProcessor.find_contact_columns(data.columns)["phone"], suppression_paths, suppressed_statuses)
+            data = data[~suppressed].reset_index(drop=True)
+        for partition, rows in data.groupby(MapReduce.block_partitions(data, block_columns, partitions)).indices.items():
+            folder = os.path.join(work_dir, "partitions", f"{partition:05d}")
+            os.makedirs(folder, exist_ok=True)
+            data.iloc[rows].to_pickle(os.path.join(folder, f"{number:05d}.pkl"))
+        return rows_loaded, rows_loaded - len(data)
+
+    @staticmethod
+    def write_pieces(data, folder):
+        """Write a frame to folder as numbered pickles of CHUNK_ROWS rows, for merge_shards to read one at a time."""
+        os.makedirs(folder, exist_ok=True)
+        for number, chunk in enumerate(DataProcessor.iter_chunks(data)):
+            chunk.to_pickle(os.path.join(folder, f"{number:05d}.pkl"))
+
+    @staticmethod
+    def reduce_partition(work_dir, partition, columns, common_columns, match_mode):
+        """Reduce: dedup one partition on its own and write its survivors and clusters as sorted shards.
+
+        The survivors keep input order (SURVIVOR_ORDER, with the file number in _file_number), the
+        clusters the order duplicate_clusters gives them. Returns (survivors, cluster lines).
+        """
+        folder = os.path.join(work_dir, "partitions", partition)
+        numbers, frames = [], []
+        for name in sorted(os.listdir(folder)):
+            frames.append(pd.read_pickle(os.path.join(folder, name)))
+            numbers.append(np.full(len(frames[-1]), int(name.split(".")[0])))
+        # Every partition sees the combined columns, in the order the single-process run has them
+        data = pd.concat(frames, ignore_index=True).reindex(columns=columns)
+        matches = DataProcessor.find_duplicates(data, common_columns, match_mode)
+        keep = np.ones(len(data), dtype=bool)
+        keep[matches["row"].to_numpy()] = False
+        # Shards are read in file order and map_file keeps the row order, so the survivors are sorted already
+        survivors = data[keep].assign(_file_number=np.concatenate(numbers)[keep])
+        clusters = DataProcessor.duplicate_clusters(data, matches)
+        MapReduce.write_pieces(survivors, os.path.join(work_dir, "survivors", partition))
+        MapReduce.write_pieces(clusters, os.path.join(work_dir, "clusters", partition))
+        return len(survivors), len(clusters)
+
+    @staticmethod
+    def merge_shards(root, sort_columns):
+        """Yield the rows of the sorted shards under root (a folder of pieces each) as chunks in sort_columns order.
+
+        One piece per shard is read at a time; rows are yielded once no unread piece can sort before them.
+        """
+        names = sorted(os.listdir(root)) if os.path.isdir(root) else []
+        unread = [deque(os.path.join(root, name, piece) for piece in sorted(os.listdir(os.path.join(root, name))))
+                  for name in names]
+        buffers = [None] * len(unread)
+        while True:
+            for shard, pieces in enumerate(unread):
+                if (buffers[shard] is None or buffers[shard].empty) and pieces:
+                    buffers[shard] = pd.read_pickle(pieces.popleft())
+            live = [shard for shard, buffer in enumerate(buffers) if buffer is not None and not buffer.empty]
+            if not live:
+                return
+            merged = pd.concat([buffers[shard].assign(_shard=shard) for shard in live], ignore_index=True)
+            merged = merged.sort_values(sort_columns, kind="stable", ignore_index=True)
+            # A shard with unread pieces continues after its last buffered row; nothing past that row is final
+            last = {shard: positions[-1] for shard, positions in merged.groupby("_shard").indices.items()}
+            cut = min((last[shard] + 1 for shard in live if unread[shard]), default=len(merged))
+            yield merged.iloc[:cut].drop(columns="_shard")
+            rest = merged.iloc[cut:]
+            for shard in live:
+                buffers[shard] = rest[rest["_shard"].to_numpy() == shard].drop(columns="_shard")
+
+    @staticmethod
+    def split_survivors(chunks, work_dir, columns, columns_to_keep, partition_by=None, zip_prefix=3):
+        """One pass over the merged survivors for what needs all of them: person links and partitions.
+
+        Returns the columns person_links reads, for every survivor, and with partition_by a
+        ChunkSource per partition key over output rows written to that partition's own pieces.
+        """
+        people, folders, pieces, sizes = [], {}, {}, {}
+        for chunk in chunks:
+            people.append(chunk[DataProcessor.person_columns(chunk.columns)])
+            if not partition_by:
+                continue
+            keys = DataProcessor.partition_keys(chunk, partition_by, zip_prefix)
+            for key, positions in keys.groupby(list(keys.columns)).indices.items():
+                key = key if isinstance(key, tuple) else (key,)
+                if key not in folders:
+                    folders[key] = os.path.join(work_dir, "output_partitions", f"{len(folders):05d}")
+                    os.makedirs(folders[key])
+                    pieces[key], sizes[key] = [], 0
+                pieces[key].append(os.path.join(folders[key], f"{len(pieces[key]):05d}.pkl"))
+                chunk.take(positions).reindex(columns=columns_to_keep).to_pickle(pieces[key][-1])
+                sizes[key] += len(positions)
+        people = pd.concat(people, ignore_index=True) if people \
+            else pd.DataFrame(columns=DataProcessor.person_columns(columns))
+        partitions = {key: ChunkSource(columns_to_keep, sizes[key],
+                                       lambda paths=paths: (pd.read_pickle(path) for path in paths))
+                      for key, paths in pieces.items()}
+        return people, partitions
+
+    @staticmethod
+    def gather(executor, calls, progress, stage):
+        """Submit fn(*args) for every call and return the results in call order, advancing stage per result.
+
+        On a failure or cancellation the calls not yet started are cancelled before the error propagates.
+        """
+        futures = [executor.submit(fn, *args) for fn, *args in calls]
+        pending = set(futures)
+        try:
+            while pending:
+                done, pending = wait(pending, timeout=0.5, return_when=FIRST_COMPLETED)
+                for future in done:
+                    future.result()
+                    progress.advance(stage)
+                progress.checkpoint()
+        except BaseException:
+            for future in futures:
+                future.cancel()
+            raise
+        return [future.result() for future in futures]
+
+    @staticmethod
+    def run(file_paths, output_folder, output_type, partitions=None, match_mode="subset", suppression_paths=(),
+            suppressed_statuses=(), csv_compression=None, partition_by=None, zip_prefix=3, executor=None,
+            work_dir=None, progress=None):
+        """DataProcessor.run over hash partitions; returns the same ProcessingResult for the same inputs.
+
+        partitions defaults to the CPU count, and so does the number of local processes when no
+        executor is given. The intermediate files go to work_dir (by default a folder in output_folder
+        that is removed afterwards). The reduce tasks leave their survivors and clusters there, and
+        the outputs are streamed from a merge of those shards, so the rows are never all in memory
+        at once; result.data is None. The persistent index is not supported here: its lookups and
+        additions have to follow each other in one place.
+        """
+        output_types = DataProcessor.check_arguments(file_paths, output_folder, output_type, csv_compression,
+                                                     partition_by)
+        partitions = partitions or os.cpu_count() or 1
+        progress = progress or ProgressReporter()
+
+        os.makedirs(output_folder, exist_ok=True)
+        own_work_dir = work_dir is None
+        work_dir = work_dir or os.path.join(output_folder, f".mapreduce-{uuid.uuid4().hex[:8]}")
+        os.makedirs(os.path.join(work_dir, "normalized"), exist_ok=True)
+        own_executor = executor is None
+        executor = executor or ProcessPoolExecutor(min(partitions, os.cpu_count() or 1))
+        try:
+            try:
+                progress.start("load", len(file_paths))
+                file_columns = MapReduce.gather(executor, [(MapReduce.normalize_file, path, number, work_dir)
+                                                           for number, path in enumerate(file_paths)], progress,
+                                                "load")
+                progress.finish("load")
+
+                # The combined columns in pd.concat order, and the common ones, as the single-process run finds them
+                columns = list(dict.fromkeys(col for names in file_columns for col in names))
+                columns_to_keep = DataProcessor.output_columns(columns)
+                common_columns = set.intersection(*(set(names) - set(DataProcessor.SOURCE_COLUMNS)
+                                                    for names in file_columns)).intersection(columns_to_keep)
+                contact_columns = DataProcessor.find_contact_columns(columns)
+                if common_columns:
+                    block_columns = sorted(common_columns - set(contact_columns["phone"]) -
+                                           set(contact_columns["email"]))
+                else:
+                    block_columns = [col for col in columns if col not in DataProcessor.SOURCE_COLUMNS]
+
+                progress.start("map", len(file_paths))
+                counts = MapReduce.gather(executor, [(MapReduce.map_file, number, work_dir, block_columns, partitions,
+                                                      tuple(suppression_paths), tuple(suppressed_statuses))
+                                                     for number in range(len(file_paths))], progress, "map")
+                progress.finish("map")
+                rows_loaded = sum(loaded for loaded, _ in counts)
+                rows_suppressed = sum(suppressed for _, suppressed in counts)
+
+                partition_root = os.path.join(work_dir, "partitions")
+                folders = sorted(os.listdir(partition_root)) if os.path.isdir(partition_root) else []
+                warnings = MapReduce.partition_warnings(block_columns, partitions, len(folders))
+                progress.start("compare", len(folders))
+                reduced = MapReduce.gather(executor, [(MapReduce.reduce_partition, work_dir, folder, columns,
+                                                       common_columns, match_mode)
+                                                      for folder in folders], progress, "compare")
+                progress.finish("compare")
+            finally:
+                if own_executor:
+                    executor.shutdown(cancel_futures=True)
+
+            # Survivors back in input order and clusters in duplicate_clusters order, merged from the shards
+            survivors = sum(count for count, _ in reduced)
+            merged = lambda: MapReduce.merge_shards(os.path.join(work_dir, "survivors"), MapReduce.SURVIVOR_ORDER)
+            rows = ChunkSource(columns_to_keep, survivors,
+                               lambda: (chunk.reindex(columns=columns_to_keep) for chunk in merged()))
+            no_matches = pd.DataFrame({"row": [], "match": [], "rule": []}, dtype=np.int64)
+            clusters = ChunkSource(
+                DataProcessor.duplicate_clusters(pd.DataFrame(columns=columns), no_matches).columns,
+                sum(count for _, count in reduced),
+                lambda: MapReduce.merge_shards(os.path.join(work_dir, "clusters"), MapReduce.CLUSTER_ORDER))
+            people, partition_sources = MapReduce.split_survivors(merged(), work_dir, columns, columns_to_keep,
+                                                                  partition_by, zip_prefix)
+            output_files, partition_files, clusters_file, people_file = DataProcessor.write_result(
+                rows, partition_sources, clusters, people, output_folder, output_types, csv_compression, progress)
+        finally:
+            if own_work_dir:
+                shutil.rmtree(work_dir, ignore_errors=True)
+
+        return ProcessingResult(
+            output_files=output_files,
+            partition_files=partition_files,
+            clusters_file=clusters_file,
+            people_file=people_file,
+            links_file=None,
+            batch=None,
+            files=list(file_paths),
+            rows_loaded=rows_loaded,
+            rows_suppressed=rows_suppressed,
+            duplicates_count=rows_loaded - rows_suppressed - survivors,
+            rows_written=survivors,
+            warnings=warnings,
+            data=None,
+        )
@@ -0,0 +1,74 @@
+import re
+
+import numpy as np
+import pandas as pd
+
+
+class PeopleTable:
+    # 'First Name' / 'Last Name' (dialer exports) are slot 0, 'Owner N First Name' (Propwire) is slot N
+    SLOT_PATTERN = re.compile(r"^(?:owner (\d+) )?(first|last) name$", re.IGNORECASE)
+    COLUMNS = ["row_id", "slot", "first", "last", "person_key"]
+
+    @staticmethod
+    def find_name_slots(columns):
+        """Map each name slot to its (first name column, last name column) pair."""
+        slots = {}
+        for col in columns:
+            match = PeopleTable.SLOT_PATTERN.match(str(col).strip())
+            if not match:
+                continue
+            slot = int(match.group(1) or 0)
+            first, last = slots.get(slot, (None, None))
+            if match.group(2).lower() == "first":
+                first = col
+            else:
+                last = col
+            slots[slot] = (first, last)
+        return dict(sorted(slots.items()))
+
+    @staticmethod
+    def normalize_names(values):
+        """Lowercase and keep letters only, so 'Trejo-Labra' and 'trejolabra' hash the same."""
+        return pd.Series(values, dtype=object).fillna("").astype(str).str.lower().str.replace(
+            r"[^a-z]", "", regex=True).to_numpy(dtype=object)
+
+    @staticmethod
+    def slot_matrix(data, columns):
+        """Stack the given columns side by side, with empty strings standing in for missing ones."""
+        empty = np.full(len(data), "", dtype=object)
+        return np.column_stack([data[col].to_numpy(dtype=object) if col is not None else empty
+                                for col in columns])
+
+    @staticmethod
+    def explode_owners(data):
+        """Reshape wide owner name slots into a long table of (row_id, slot, first, last, person_key)."""
+        slots = PeopleTable.find_name_slots(data.columns)
+        if not slots or data.empty:
+            return pd.DataFrame(columns=PeopleTable.COLUMNS)
+
+        slot_ids = np.fromiter(slots.keys(), dtype=np.int16)
+        first = PeopleTable.slot_matrix(data, [pair[0] for pair in slots.values()])
+        last = PeopleTable.slot_matrix(data, [pair[1] for pair in slots.values()])
+
+        # Row-major ravel keeps every row's slots next to each other
+        people = pd.DataFrame({
+            "row_id": np.repeat(data.index.to_numpy(), len(slot_ids)),
+            "slot": np.tile(slot_ids, len(data)),
+            "first": PeopleTable.normalize_names(first.ravel()),
+            "last": PeopleTable.normalize_names(last.ravel()),
+        })
+        people = people[(people["first"] != "") | (people["last"] != "")].reset_index(drop=True)
+        people["person_key"] = pd.util.hash_pandas_object(people[["first", "last"]], index=False).to_numpy()
+        return people
+
+    @staticmethod
+    def link_people(people, other=None, on=("person_key",)):
+        """Join people on person_key (plus any blocking columns in on); pairs of rows sharing a person in any slot."""
+        self_join = other is None
+        other = people if self_join else other
+        pairs = people.merge(other, on=list(on), suffixes=("", "_other"))
+        if self_join:
+            # Each unordered pair once, and never a row with itself
+            pairs = pairs[pairs["row_id"] < pairs["row_id_other"]]
+        return pairs[["row_id", "slot", "row_id_other", "slot_other", "first", "last", "person_key"]] \
+            .drop_duplicates(["row_id", "row_id_other"]).reset_index(drop=True)
@@ -0,0 +1,145 @@
+import tkinter as tk
+import customtkinter as ctk
+
+from Loaders import ModuleLoader
+
+
+class ListRows:
+    """Rows already in memory, such as the first survivors streamed from a running job."""
+
+    def __init__(self, columns, rows):
+        self.columns = list(columns)
+        self.data = rows
+
+    def __len__(self):
+        return len(self.data)
+
+    def rows(self, start, stop):
+        return self.data[start:stop]
+
+
+class FeatherRows:
+    """Random access to the rows of an uncompressed Feather (Arrow IPC) file through a memory map.
+
+    The table's columns point into the map, so opening reads only the batches' metadata and
+    scrolling touches only the pages holding the requested rows, whatever the file's size.
+    """
+
+    def __init__(self, path):
+        pa = ModuleLoader.module("pyarrow")
+        pa_ipc = ModuleLoader.module("pyarrow.ipc")
+        self.table = pa_ipc.open_file(pa.memory_map(path, "r")).read_all()
+        self.columns = self.table.schema.names
+
+    def __len__(self):
+        return self.table.num_rows
+
+    def rows(self, start, stop):
+        part = self.table.slice(start, max(min(stop, len(self)) - start, 0))
+        rows = zip(*(column.to_pylist() for column in part.columns))
+        return [["" if value is None else str(value) for value in row] for row in rows]
+
+
+class PreviewGrid(ctk.CTkFrame):
+    """Read-only table that draws only the rows and columns in view.
+
+    The source is anything with columns, len() and rows(start, stop) returning lists of strings;
+    the vertical scrollbar is virtual, so scrolling never creates more canvas items than fit.
+    """
+
+    ROW_HEIGHT = 20
+    COLUMN_WIDTH = 130
+    WHEEL_ROWS = 3
+
+    def __init__(self, master, theme):
+        super().__init__(master, fg_color=theme["bg"])
+        self.theme = theme
+        self.source = None
+        self.first = 0
+
+        self.canvas = tk.Canvas(self, highlightthickness=0, bg=theme["bg"])
+        self.v_scroll = ctk.CTkScrollbar(self, orientation="vertical", command=self.on_scroll)
+        self.h_scroll = ctk.CTkScrollbar(self, orientation="horizontal", command=self.on_xscroll)
+        self.canvas.configure(xscrollcommand=self.h_scroll.set)
+        self.canvas.grid(row=0, column=0, sticky="nsew")
+        self.v_scroll.grid(row=0, column=1, sticky="ns")
+        self.h_scroll.grid(row=1, column=0, sticky="ew")
+        self.grid_rowconfigure(0, weight=1)
+        self.grid_columnconfigure(0, weight=1)
+
+        self.canvas.bind("<Configure>", lambda event: self.redraw())
+        for sequence in ("<MouseWheel>", "<Button-4>", "<Button-5>"):
+            self.canvas.bind(sequence, self.on_wheel)
+
+    def set_source(self, source, keep_position=False):
+        """Show another source; keep_position is for the same rows arriving from a fuller source."""
+        self.source = source
+        if not keep_position:
+            self.first = 0
+            self.canvas.xview_moveto(0)
+        self.canvas.configure(scrollregion=(0, 0, len(source.columns) * PreviewGrid.COLUMN_WIDTH, 1))
+        self.scroll_to(self.first)
+
+    def clear(self):
+        self.source = None
+        self.first = 0
+        self.redraw()
+
+    def visible_rows(self):
+        # One line is taken by the header
+        return max(self.canvas.winfo_height() // PreviewGrid.ROW_HEIGHT - 1, 1)
+
+    def scroll_to(self, first):
+        total = len(self.source) if self.source else 0
+        self.first = max(0, min(int(first), total - self.visible_rows()))
+        self.redraw()
+
+    def on_scroll(self, action, amount, unit=None):
+        if not self.source:
+            return
+        if action == "moveto":
+            self.scroll_to(float(amount) * len(self.source))
+        elif action == "scroll":
+            step = self.visible_rows() if unit == "pages" else 1
+            self.scroll_to(self.first + int(amount) * step)
+
+    def on_xscroll(self, *args):
+        self.canvas.xview(*args)
+        self.redraw()
+
+    def on_wheel(self, event):
+        up = event.num == 4 or getattr(event, "delta", 0) > 0
+        self.scroll_to(self.first + (-1 if up else 1) * PreviewGrid.WHEEL_ROWS)
+
+    def apply_theme(self, theme):
+        self.theme = theme
+        self.configure(fg_color=theme["bg"])
+        self.canvas.configure(bg=theme["bg"])
+        self.redraw()
+
+    def redraw(self):
+        self.canvas.delete("all")
+        if not self.source or not self.source.columns:
+            self.v_scroll.set(0, 1)
+            return
+
+        width, height = PreviewGrid.COLUMN_WIDTH, PreviewGrid.ROW_HEIGHT
+        left = int(self.canvas.canvasx(0)) // width
+        right = min(left + self.canvas.winfo_width() // width + 2, len(self.source.columns))
+        rows = self.source.rows(self.first, self.first + self.visible_rows())
+        # Text past the column width is cut rather than wrapped
+        chars = width // 7
+
+        for col in range(left, right):
+            self.canvas.create_text(col * width + 4, height / 2, anchor="w", fill=self.theme["fg"],
+                                    text=str(self.source.columns[col])[:chars], font=("TkDefaultFont", 9, "bold"))
+            for line, row in enumerate(rows, start=1):
+                self.canvas.create_text(col * width + 4, (line + 0.5) * height, anchor="w", fill=self.theme["fg"],
+                                        text=row[col][:chars], font=("TkDefaultFont", 9))
+        self.canvas.create_line(left * width, height, right * width, height, fill=self.theme["button_bg"])
+
+        total = len(self.source)
+        if total:
+            self.v_scroll.set(self.first / total, (self.first + len(rows)) / total)
+        else:
+            self.v_scroll.set(0, 1)
@@ -1,62 +1,189 @@
 import os
-from tkinter import filedialog
+import re
+from collections import namedtuple
+from concurrent.futures import ThreadPoolExecutor, wait
+import numpy as np
 import pandas as pd
-import tabula
-from reportlab.lib import colors
-from reportlab.lib.pagesizes import letter
-from reportlab.lib.units import inch
-from reportlab.platypus import SimpleDocTemplate, Table, TableStyle
+from fuzzywuzzy import fuzz
+
+from ColumnProfiler import ColumnProfiler
+from ContactSets import ContactSets
+from DedupIndex import DedupIndex
+from Loaders import ModuleLoader
+from PeopleTable import PeopleTable
+from Progress import JobCancelled, ProgressReporter
+from Suppression import SuppressionList
+from Writers import ColumnarWriter, CsvStreamWriter, ExcelStreamWriter, PdfReportWriter
+
+
+# Outcome of one run: the written files, the row counts at each step and the deduplicated rows
+ProcessingResult = namedtuple("ProcessingResult", [
+    "output_files",      # {output type: path}
+    "partition_files",   # {(partition key, output type): path}, empty without partition_by
+    "clusters_file",
+    "people_file",       # None when no surviving rows of different files share a person
+    "links_file",        # None unless incremental
+    "batch",             # index batch id, None without an index
+    "files",             # input files actually processed (incremental runs skip ingested ones)
+    "rows_loaded",
+    "rows_suppressed",
+    "duplicates_count",  # in-batch duplicates plus rows already in the index
+    "rows_written",
+    "warnings",          # notes on how the run went that did not stop it, as text
+    "data",              # the written rows; None from MapReduce.run, whose rows stay on disk
+])
+
+# Rows to write: their columns, their count, and a function returning a fresh iterator of DataFrame
+# chunks in output order, so every format and partition streams them on its own
+ChunkSource = namedtuple("ChunkSource", ["columns", "rows", "chunks"])
 
 
 class DataProcessor:
+    # Lineage of every row (file name, row number in that file); never part of matching or output
+    SOURCE_COLUMNS = ["_source_file", "_source_row"]
+    OUTPUT_EXTENSIONS = {"Excel": "xlsx", "CSV": "csv", "PDF": "pdf", "Parquet": "parquet", "Feather": "feather"}
+    # What partition_by may name; see partition_keys
+    PARTITION_COLUMNS = ("State", "Zip", "Source")
+    # Rows handed to streaming writers at a time
+    CHUNK_ROWS = 50_000
+    # Rows sent to the GUI preview before the outputs are written
+    PREVIEW_ROWS = 1_000
+
     @staticmethod
-    def process_files(file_paths, output_type):
-        """Process multiple files, combining data, removing duplicates on common fields, and saving in the specified output format."""
-        all_data = pd.DataFrame()
-        file_columns = []
+    def process_files(file_paths, output_type, output_folder=None, **options):
+        """Process multiple files, combining data, removing duplicates on common fields, and saving in the specified output format.
 
-        # Load and concatenate data from all files
-        for file_path in file_paths:
-            data = DataProcessor.load_data(file_path)
-            data = DataProcessor.preprocess_data(data)
-            file_columns.append(set(data.columns))
-            all_data = pd.concat([all_data, data], ignore_index=True)
+        Kept for callers of the (success, data, duplicates_count) form; without output_folder it asks for one.
+        The options are those of run().
+        """
+        result = DataProcessor.run(file_paths, output_folder or DataProcessor.select_output_folder(), output_type,
+                                   **options)
+        return True, result.data, result.duplicates_count
 
-        # Dynamically detect columns using fuzzy matching
-        owner_columns = DataProcessor.find_similar_columns("Owner", all_data.columns)
-        phone_columns = DataProcessor.find_similar_columns("Phone", all_data.columns)
-        name_columns = [col for col in all_data.columns if col in ["First Name", "Last Name"]]
-        email_columns = DataProcessor.find_similar_columns("Email", all_data.columns)
+    @staticmethod
+    def run(file_paths, output_folder, output_type, match_mode="subset", index_path=None, incremental=False,
+            bloom_fp_rate=DedupIndex.DEFAULT_FP_RATE, suppression_paths=(), suppressed_statuses=(),
+            csv_compression=None, partition_by=None, zip_prefix=3, progress=None):
+        """Deduplicate file_paths into output_folder without any user interaction; returns a ProcessingResult.
 
-        # Define fixed columns we always want to include if present
-        fixed_columns = ['Id', 'Address', 'City', 'State', 'Zip', 'County']
+        output_type is one format name or a collection of them; all of them are written from the same result.
 
-        # Combine all detected columns to form the final output structure
-        columns_to_keep = (
-                fixed_columns + sorted(owner_columns) + sorted(phone_columns) +
-                sorted(name_columns) + sorted(email_columns)
-        )
+        With index_path, rows already handled in earlier runs are dropped too; bloom_fp_rate tunes the
+        filter that screens keys before the exact index lookup. Incremental mode also skips files the
+        index has already ingested and writes the new duplicate links next to the output.
+        Rows with a phone from one of the suppression_paths lists or one of the suppressed_statuses
+        are removed before duplicate detection. CSV output can be compressed with "gzip" or "zstd".
+        partition_by (e.g. ["State", "Zip"]) additionally writes one file per territory, keyed on the first
+        zip_prefix digits of the zip code; "Source" partitions by input file.
+        A ProgressReporter passed as progress receives stage events (files loaded, rows normalized,
+        blocks compared, rows written) as the run goes; its CancelToken, if any, is checked at every
+        file, comparison pass and written chunk. A cancelled run raises JobCancelled, leaves no partial
+        output files and does not touch the index.
+        """
+        if incremental and not index_path:
+            raise ValueError("Incremental mode needs a dedup index")
+        output_types = DataProcessor.check_arguments(file_paths, output_folder, output_type, csv_compression,
+                                                     partition_by)
+        progress = progress or ProgressReporter()
+
+        index = DedupIndex(index_path, bloom_fp_rate) if index_path else None
+        try:
+            digests = {path: DedupIndex.file_digest(path) for path in file_paths} if index else {}
+            if incremental:
+                # Only files the index has not seen yet are loaded and normalized
+                known = index.known_files(digests.values())
+                file_paths = [path for path in file_paths if digests[path] not in known]
+                if not file_paths:
+                    raise ValueError("All selected files were already processed into the index")
 
-        # Identify common columns across all files for duplicate detection
-        common_columns = set.intersection(*file_columns)
-        common_columns = common_columns.intersection(columns_to_keep)
+            all_data = pd.DataFrame()
+            file_columns = []
 
-        # Apply weighted duplicate detection for more flexible matching
-        duplicates_removed = DataProcessor.detect_duplicates(all_data, common_columns)
+            # Load and concatenate data from all files
+            progress.start("load", len(file_paths))
+            progress.start("normalize")
+            for file_path in file_paths:
+                data = DataProcessor.load_normalized(file_path)
+                progress.advance("load")
+                progress.advance("normalize", len(data))
+                file_columns.append(set(data.columns) - set(DataProcessor.SOURCE_COLUMNS))
+                all_data = pd.concat([all_data, data], ignore_index=True)
+            progress.finish("load")
+            progress.finish("normalize")
 
-        # Keep only the specified columns in the final output, filling missing columns as needed
-        filtered_data = duplicates_removed.reindex(columns=columns_to_keep).fillna("")
+            columns_to_keep = DataProcessor.output_columns(all_data.columns)
 
-        duplicates_count = len(all_data) - len(duplicates_removed)
+            # Identify common columns across all files for duplicate detection
+            common_columns = set.intersection(*file_columns)
+            common_columns = common_columns.intersection(columns_to_keep)
 
-        output_folder = DataProcessor.select_output_folder()
-        if not os.path.exists(output_folder):
-            os.makedirs(output_folder)
+            progress.checkpoint()
+            # Suppressed rows never reach the comparison stage
+            rows_loaded = len(all_data)
+            if suppression_paths or suppressed_statuses:
+                suppressed = SuppressionList.suppressed_rows(
+                    all_data, DataProcessor.find_contact_columns(all_data.columns)["phone"],
+                    suppression_paths, suppressed_statuses)
+                all_data = all_data[~suppressed].reset_index(drop=True)
 
-        output_file = os.path.join(output_folder, f"output_combined_files.{output_type.lower()}")
-        DataProcessor.save_output(filtered_data, output_file, output_type)
+            # Apply weighted duplicate detection for more flexible matching
+            matches = DataProcessor.find_duplicates(all_data, common_columns, match_mode, progress)
+            duplicates_removed = all_data.drop(all_data.index[matches["row"]]).reset_index(drop=True)
 
-        return True, filtered_data, duplicates_count
+            # Drop rows already handled in earlier runs; their keys are recorded once the output is written
+            if index:
+                progress.checkpoint()
+                duplicates_removed, seen, new_keys = DataProcessor.split_seen(duplicates_removed, index)
+
+            # Keep only the specified columns in the final output; writers render missing values as blanks
+            filtered_data = duplicates_removed.reindex(columns=columns_to_keep)
+
+            duplicates_count = len(all_data) - len(duplicates_removed)
+
+            head = filtered_data.head(DataProcessor.PREVIEW_ROWS)
+            progress.preview([str(col) for col in head.columns], head.fillna("").astype(str).values.tolist(),
+                             len(filtered_data))
+
+            partitions = {}
+            if partition_by:
+                keys = DataProcessor.partition_keys(duplicates_removed, partition_by, zip_prefix)
+                partitions = DataProcessor.frame_partitions(filtered_data, keys)
+            # Audit trail: which rows were dropped, which row survived for them and why
+            clusters = DataProcessor.duplicate_clusters(all_data, matches, seen if index else None)
+            output_files, partition_files, clusters_file, people_file = DataProcessor.write_result(
+                DataProcessor.frame_source(filtered_data), partitions, DataProcessor.frame_source(clusters),
+                duplicates_removed, output_folder, output_types, csv_compression, progress)
+
+            # Past this point the run is committed: the index follows the output
+            batch, links_file = None, None
+            if index:
+                batch = DedupIndex.new_batch_id()
+                if incremental:
+                    links = DataProcessor.duplicate_links(all_data, matches, seen, batch)
+                    links_file = os.path.join(output_folder, "output_duplicate_links.csv")
+                    links.to_csv(links_file, index=False)
+                lineage = duplicates_removed[DataProcessor.SOURCE_COLUMNS].set_axis(["source", "source_row"], axis=1)
+                index.add(new_keys, lineage, [os.path.basename(path) for path in file_paths], batch,
+                          [(digests[path], os.path.basename(path)) for path in file_paths])
+        finally:
+            if index:
+                index.close()
+
+        return ProcessingResult(
+            output_files=output_files,
+            partition_files=partition_files,
+            clusters_file=clusters_file,
+            people_file=people_file,
+            links_file=links_file,
+            batch=batch,
+            files=list(file_paths),
+            rows_loaded=rows_loaded,
+            rows_suppressed=rows_loaded - len(all_data),
+            duplicates_count=duplicates_count,
+            rows_written=len(filtered_data),
+            warnings=[],
+            data=filtered_data,
+        )
 
     @staticmethod
     def load_data(file_path):
@@ -72,6 +199,8 @@ class DataProcessor:
 
     @staticmethod
     def extract_pdf(file_path):
+        # tabula is only needed for PDF input, so it is imported on first use
+        tabula = ModuleLoader.require("tabula", "PDF input")
         tables = tabula.read_pdf(file_path, pages='all', multiple_tables=False)
         if tables:
             return tables[0]
@@ -91,79 +220,436 @@ class DataProcessor:
         return [col for col in columns if fuzz.partial_ratio(target_col.lower(), col.lower()) >= threshold]
 
     @staticmethod
-    def detect_duplicates(data, common_columns):
+    def find_contact_columns(columns):
+        """Group the phone and email slot columns, e.g. {"phone": ["Alt. Phone", "Phone"], "email": ["Email"]}."""
+        phone_cols = DataProcessor.find_similar_columns("Phone", columns)
+        # 'Owner Mailing Address' scores 80 against 'Email' but holds address parts, not emails
+        email_cols = [col for col in DataProcessor.find_similar_columns("Email", columns)
+                      if col not in phone_cols and "mailing" not in col.lower()]
+        return {"phone": sorted(phone_cols), "email": sorted(email_cols)}
+
+    @staticmethod
+    def detect_duplicates(data, common_columns, match_mode="subset"):
         """Detect duplicates, accounting for swapped or missing alternate phone and email fields."""
-        if not common_columns:
-            return data.drop_duplicates()
-
-        # Define specific column names for phone and email
-        phone_cols = DataProcessor.find_similar_columns("Phone", data.columns)
-        email_cols = DataProcessor.find_similar_columns("Email", data.columns)
-
-        def is_duplicate(row1, row2):
-            """Determine if two rows are duplicates, considering swapped or missing alternate fields."""
-            # Check for equality in non-contact fields
-            for col in common_columns - set(phone_cols) - set(email_cols):
-                if row1[col] != row2[col]:
-                    return False
-
-            # Check for swapped or missing alternate phone
-            for col_set in [phone_cols, email_cols]:
-                if len(col_set) == 2:
-                    primary, alternate = col_set
-                    # Extract values for comparison
-                    values1 = {row1[primary], row1[alternate]} - {""}
-                    values2 = {row2[primary], row2[alternate]} - {""}
-
-                    # Check if values match as sets, allowing for swapped or single-field scenarios
-                    if not (values1 == values2 or values1.issubset(values2) or values2.issubset(values1)):
-                        return False
-
-            return True
-
-        # Iterate over rows and mark duplicates based on custom criteria
-        duplicates = []
-        for i in range(len(data)):
-            for j in range(i + 1, len(data)):
-                if is_duplicate(data.iloc[i], data.iloc[j]):
-                    duplicates.append(j)
+        matches = DataProcessor.find_duplicates(data, common_columns, match_mode)
 
         # Drop marked duplicate rows
-        return data.drop(duplicates, axis=0).reset_index(drop=True)
+        return data.drop(data.index[matches["row"]], axis=0).reset_index(drop=True)
+
+    @staticmethod
+    def load_normalized(file_path):
+        """One input file, normalized for matching and tagged with its lineage columns."""
+        data = DataProcessor.load_data(file_path)
+        # Name blank-header columns from their content before punctuation is stripped
+        data = ColumnProfiler.map_unlabeled_columns(data)
+        data = DataProcessor.preprocess_data(data)
+        data["_source_file"] = os.path.basename(file_path)
+        data["_source_row"] = np.arange(len(data))
+        return data
+
+    @staticmethod
+    def output_columns(columns):
+        """The output structure for the combined columns: fixed fields, then owners, phones, names and emails."""
+        # Dynamically detect columns using fuzzy matching
+        owner_columns = DataProcessor.find_similar_columns("Owner", columns)
+        phone_columns = DataProcessor.find_similar_columns("Phone", columns)
+        name_columns = [col for col in columns if col in ["First Name", "Last Name"]]
+        email_columns = DataProcessor.find_similar_columns("Email", columns)
+
+        # Define fixed columns we always want to include if present
+        fixed_columns = ['Id', 'Address', 'City', 'State', 'Zip', 'County']
+
+        # 'Owner Mailing Zip' is found as an owner and an email column; each column is output once
+        return list(dict.fromkeys(
+                fixed_columns + sorted(owner_columns) + sorted(phone_columns) +
+                sorted(name_columns) + sorted(email_columns)
+        ))
+
+    @staticmethod
+    def find_duplicates(data, common_columns, match_mode="subset", progress=None):
+        """Return (row, match, rule) for every row that duplicates an earlier row, by position."""
+        if not common_columns:
+            # Without shared fields only fully identical rows are duplicates
+            columns = [col for col in data.columns if col not in DataProcessor.SOURCE_COLUMNS]
+            return ContactSets.find_matches(data, columns, {}, "exact", progress)
+
+        # Any number of phone and email slots is compared as an unordered set of values
+        contact_columns = DataProcessor.find_contact_columns(data.columns)
+        phone_cols, email_cols = contact_columns["phone"], contact_columns["email"]
+
+        # Non-contact fields have to match exactly
+        group_columns = sorted(common_columns - set(phone_cols) - set(email_cols))
+
+        return ContactSets.find_matches(data, group_columns, contact_columns, match_mode, progress)
+
+    @staticmethod
+    def split_seen(data, index):
+        """Split off rows whose contact (or, lacking contacts, address) keys are in the persistent index.
+
+        Returns the unseen rows, the index hits per dropped row and the unseen rows' keys.
+        """
+        keys = DedupIndex.extract_keys(data, DataProcessor.find_contact_columns(data.columns))
+        seen = index.find_seen(keys, len(data))
+        keep = np.ones(len(data), dtype=bool)
+        keep[seen["row"].to_numpy()] = False
+        seen = seen.drop_duplicates("row").assign(
+            _source_file=lambda hits: data["_source_file"].to_numpy()[hits["row"].to_numpy()],
+            _source_row=lambda hits: data["_source_row"].to_numpy()[hits["row"].to_numpy()])
+
+        # Only the survivors' keys are new to the index
+        return data[keep].reset_index(drop=True), seen, DataProcessor.kept_keys(keys, keep)
+
+    @staticmethod
+    def kept_keys(keys, keep):
+        """Index keys of the rows flagged in keep, renumbered to their positions among those rows."""
+        kept = keys[keep[keys["row"].to_numpy()]]
+        return kept.assign(row=(np.cumsum(keep) - 1)[kept["row"].to_numpy()])
+
+    @staticmethod
+    def duplicate_links(data, matches, seen, batch):
+        """One line per dropped row naming the row it duplicates, within this batch or from the index."""
+        kinds = {code: kind for kind, code in DedupIndex.KINDS.items()}
+        source_file = data["_source_file"].to_numpy()
+        source_row = data["_source_row"].to_numpy()
+        rows, matched = matches["row"].to_numpy(), matches["match"].to_numpy()
+        in_batch = pd.DataFrame({
+            "source_file": source_file[rows],
+            "source_row": source_row[rows],
+            "matched_file": source_file[matched],
+            "matched_row": source_row[matched],
+            "matched_batch": batch,
+            "rule": matches["rule"].to_numpy(),
+        })
+        history = pd.DataFrame({
+            "source_file": seen["_source_file"].to_numpy(),
+            "source_row": seen["_source_row"].to_numpy(),
+            "matched_file": seen["source"].to_numpy(),
+            "matched_row": seen["source_row"].to_numpy(),
+            "matched_batch": seen["batch"].to_numpy(),
+            "rule": "history:" + seen["kind"].map(kinds),
+        })
+        return pd.concat([in_batch, history], ignore_index=True)
+
+    @staticmethod
+    def duplicate_clusters(data, matches, seen=None):
+        """One line per dropped row: its cluster, the surviving row, the row it matched directly and the rule.
+
+        Chains of matches collapse onto the row that survived; rows dropped because an earlier run had
+        them (seen, from split_seen) make that historical row the survivor of their whole cluster.
+        """
+        parent = DataProcessor.match_roots(len(data), matches["row"].to_numpy(), matches["match"].to_numpy())
+
+        source_file = data["_source_file"].to_numpy()
+        source_row = data["_source_row"].to_numpy()
+        rows, matched = matches["row"].to_numpy(), matches["match"].to_numpy()
+        clusters = pd.DataFrame({
+            "survivor_file": source_file[parent[rows]],
+            "survivor_row": source_row[parent[rows]],
+            "survivor_batch": "",
+            "member_file": source_file[rows],
+            "member_row": source_row[rows],
+            "matched_file": source_file[matched],
+            "matched_row": source_row[matched],
+            "rule": matches["rule"].to_numpy(),
+        })
+
+        if seen is not None and len(seen):
+            kinds = {code: kind for kind, code in DedupIndex.KINDS.items()}
+            history = pd.DataFrame({
+                "survivor_file": seen["source"].to_numpy(),
+                "survivor_row": seen["source_row"].to_numpy(),
+                "survivor_batch": seen["batch"].to_numpy(),
+                "member_file": seen["_source_file"].to_numpy(),
+                "member_row": seen["_source_row"].to_numpy(),
+                "matched_file": seen["source"].to_numpy(),
+                "matched_row": seen["source_row"].to_numpy(),
+                "rule": ("history:" + seen["kind"].map(kinds)).to_numpy(),
+            })
+            # Members of a cluster whose survivor was itself dropped by the index move to the historical row
+            survivors = history.rename(columns={"member_file": "survivor_file", "member_row": "survivor_row",
+                                                "survivor_file": "history_file", "survivor_row": "history_row",
+                                                "survivor_batch": "history_batch"})
+            roots = clusters[["survivor_file", "survivor_row"]].merge(
+                survivors[["survivor_file", "survivor_row", "history_file", "history_row", "history_batch"]],
+                how="left", on=["survivor_file", "survivor_row"])
+            rerooted = roots["history_file"].notna().to_numpy()
+            for col in ["file", "row", "batch"]:
+                clusters.loc[rerooted, f"survivor_{col}"] = roots.loc[rerooted, f"history_{col}"].to_numpy()
+            clusters = pd.concat([clusters, history], ignore_index=True)
+
+        # Stable ids: the same surviving row gives the same cluster id in every run
+        survivor = clusters["survivor_file"].astype(str) + "|" + clusters["survivor_row"].astype(str)
+        clusters.insert(0, "cluster_id", pd.util.hash_array(survivor.to_numpy(dtype=object)).view(np.int64))
+        return clusters.sort_values(["cluster_id", "member_file", "member_row"], kind="stable").reset_index(drop=True)
+
+    @staticmethod
+    def match_roots(n, rows, matched):
+        """For each of n rows, the row its chain of matches (rows[i] matched matched[i]) ends at."""
+        parent = np.arange(n)
+        parent[rows] = matched
+        # Pointer jumping: every row ends up pointing at the root of its chain in log(depth) steps
+        while True:
+            grandparent = parent[parent]
+            if (grandparent == parent).all():
+                return parent
+            parent = grandparent
+
+    @staticmethod
+    def save_clusters(clusters, output_folder):
+        """Write the cluster audit (a ChunkSource) as Parquet row groups, or as CSV when pyarrow is missing."""
+        chunks = clusters.chunks()
+        if ColumnarWriter.available():
+            output_file = os.path.join(output_folder, "output_clusters.parquet")
+            return ColumnarWriter.write(chunks, clusters.columns, output_file, "Parquet")
+        return CsvStreamWriter.write(chunks, clusters.columns, os.path.join(output_folder, "output_clusters.csv"))
+
+    @staticmethod
+    def person_links(data):
+        """Surviving rows of different input files naming the same person at the same zip, for review.
+
+        Propwire owner slots and dialer First/Last Name columns go into one long people table, so the
+        cross-file join is a single merge; names alone never drop a row.
+        """
+        people = PeopleTable.explode_owners(data)
+        people = people[(people["first"] != "") & (people["last"] != "")]
+        zips = ContactSets.as_text(data["Zip"]).to_numpy(dtype=object) if "Zip" in data.columns \
+            else np.full(len(data), "", dtype=object)
+        people = people.assign(zip=zips[people["row_id"].to_numpy(dtype=np.int64)])
+        pairs = PeopleTable.link_people(people, on=("person_key", "zip"))
+
+        source_file = data["_source_file"].to_numpy()
+        source_row = data["_source_row"].to_numpy()
+        rows = pairs["row_id"].to_numpy(dtype=np.int64)
+        others = pairs["row_id_other"].to_numpy(dtype=np.int64)
+        links = pd.DataFrame({
+            "source_file": source_file[rows],
+            "source_row": source_row[rows],
+            "slot": pairs["slot"].to_numpy(),
+            "other_file": source_file[others],
+            "other_row": source_row[others],
+            "other_slot": pairs["slot_other"].to_numpy(),
+            "first": pairs["first"].to_numpy(),
+            "last": pairs["last"].to_numpy(),
+        })
+        return links[links["source_file"] != links["other_file"]].reset_index(drop=True)
+
+    @staticmethod
+    def person_columns(columns):
+        """The columns person_links reads: the name slots, Zip and the source columns."""
+        names = {col for pair in PeopleTable.find_name_slots(columns).values() for col in pair if col is not None}
+        return [col for col in columns if col in names or col == "Zip" or col in DataProcessor.SOURCE_COLUMNS]
+
+    @staticmethod
+    def save_person_links(links, output_folder):
+        """Write the person links as CSV; returns None, and writes nothing, when there are none."""
+        if links.empty:
+            return None
+        return CsvStreamWriter.write(DataProcessor.iter_chunks(links), links.columns,
+                                     os.path.join(output_folder, "output_person_links.csv"))
 
     @staticmethod
     def select_output_folder():
+        """Ask for the output folder; only for interactive callers, from the Tk main thread."""
+        from tkinter import filedialog
         folder = filedialog.askdirectory()
         if not folder:
             raise ValueError("Output folder not selected")
         return folder
 
     @staticmethod
-    def save_output(data_frame, output_file, output_type):
+    def iter_chunks(data_frame, chunk_rows=CHUNK_ROWS, progress=None):
+        """Consecutive row slices of the frame, for writers that stream their output.
+
+        Rows are counted as written once the writer asks for the next chunk.
+        """
+        chunks = (data_frame.iloc[start:start + chunk_rows] for start in range(0, len(data_frame), chunk_rows))
+        return DataProcessor.counted(chunks, progress)
+
+    @staticmethod
+    def counted(chunks, progress=None):
+        """Pass chunks through, counting each one's rows as written once the writer asks for the next."""
+        for chunk in chunks:
+            yield chunk
+            if progress:
+                progress.advance("write", len(chunk))
+
+    @staticmethod
+    def frame_source(data_frame):
+        """A ChunkSource over the rows of an in-memory frame."""
+        return ChunkSource(data_frame.columns, len(data_frame), lambda: DataProcessor.iter_chunks(data_frame))
+
+    @staticmethod
+    def frame_partitions(data_frame, keys):
+        """A ChunkSource per partition key (a tuple) over the frame's rows with that key, taken when written."""
+        # Row positions per partition come from one groupby; no boolean filtering per key
+        groups = keys.groupby(list(keys.columns), sort=True).indices
+        return {key if isinstance(key, tuple) else (key,): ChunkSource(
+                    data_frame.columns, len(positions),
+                    lambda positions=positions: DataProcessor.iter_chunks(data_frame.take(positions)))
+                for key, positions in groups.items()}
+
+    @staticmethod
+    def check_arguments(file_paths, output_folder, output_type, csv_compression=None, partition_by=None):
+        """Check the inputs and output settings of a run before any work; returns the output types as a list."""
+        if not file_paths:
+            raise ValueError("No input files given")
+        output_types = [output_type] if isinstance(output_type, str) else list(output_type)
+        unknown = [t for t in output_types if t not in DataProcessor.OUTPUT_EXTENSIONS]
+        if not output_types or unknown:
+            raise ValueError(f"Unsupported output type: {', '.join(unknown) or 'none selected'}")
+        if not output_folder:
+            raise ValueError("Output folder not selected")
+        if csv_compression not in CsvStreamWriter.COMPRESSION_SUFFIXES:
+            raise ValueError(f"Unsupported CSV compression: {csv_compression}")
+        unknown = [str(col) for col in partition_by or () if col not in DataProcessor.PARTITION_COLUMNS]
+        if unknown:
+            raise ValueError(f"Cannot partition by: {', '.join(unknown)}")
+        return output_types
+
+    @staticmethod
+    def write_result(rows, partitions, clusters, people, output_folder, output_types, csv_compression=None,
+                     progress=None):
+        """Write the surviving rows in every format (and per partition), then the cluster audit and person links.
+
+        rows and clusters are ChunkSources, partitions maps partition keys to ChunkSources (empty
+        without partition_by), and people is a frame of the survivors holding at least the columns
+        person_links reads. Returns (output_files, partition_files, clusters_file, people_file). A
+        cancelled write removes every output file written so far before JobCancelled propagates.
+        """
+        progress = progress or ProgressReporter()
+        os.makedirs(output_folder, exist_ok=True)
+        # Every format counts its rows; partitioned output writes each row a second time
+        progress.start("write", rows.rows * len(output_types) * (2 if partitions else 1))
+        output_files, partition_files = {}, {}
+        try:
+            output_files = DataProcessor.save_outputs(rows, output_folder, output_types, csv_compression, progress)
+            if partitions:
+                partition_files = DataProcessor.save_partitioned_outputs(partitions, output_folder, output_types,
+                                                                         csv_compression, progress)
+            progress.finish("write")
+        except JobCancelled:
+            DataProcessor.remove_files(list(output_files.values()) + list(partition_files.values()))
+            raise
+        # Past this point the outputs are complete: the audit files follow them
+        clusters_file = DataProcessor.save_clusters(clusters, output_folder)
+        people_file = DataProcessor.save_person_links(DataProcessor.person_links(people), output_folder)
+        return output_files, partition_files, clusters_file, people_file
+
+    @staticmethod
+    def save_outputs(rows, output_folder, output_types, csv_compression=None, progress=None):
+        """Write one result (a ChunkSource) in several formats concurrently, one writer thread per format."""
+        output_files = {output_type: os.path.join(
+            output_folder, f"output_combined_files.{DataProcessor.OUTPUT_EXTENSIONS[output_type]}")
+            for output_type in output_types}
+        # Each writer streams its own chunks; PDF rendering fans out to its own worker processes
+        with ThreadPoolExecutor(max_workers=len(output_files)) as pool:
+            futures = [pool.submit(DataProcessor.save_source, rows, output_file, output_type, csv_compression,
+                                   progress)
+                       for output_type, output_file in output_files.items()]
+            DataProcessor.wait_all(futures, [DataProcessor.written_path(output_file, output_type, csv_compression)
+                                             for output_type, output_file in output_files.items()])
+        return {output_type: DataProcessor.written_path(output_file, output_type, csv_compression)
+                for output_type, output_file in output_files.items()}
+
+    @staticmethod
+    def written_path(output_file, output_type, csv_compression=None):
+        """The file a writer actually creates; compressed CSV gets its codec suffix."""
+        if output_type == 'CSV':
+            return CsvStreamWriter.output_path(output_file, csv_compression)
+        return output_file
+
+    @staticmethod
+    def partition_keys(data, partition_by, zip_prefix=3):
+        """Partition key columns for each row: State as is, Zip cut to its prefix, Source as the input file."""
+        keys = {}
+        for col in partition_by:
+            if col == "Source":
+                values = data["_source_file"].astype(str)
+            elif col in data.columns:
+                values = ContactSets.as_text(data[col])
+                if col == "Zip":
+                    values = values.str[:zip_prefix]
+            else:
+                raise ValueError(f"Cannot partition on missing column: {col}")
+            keys[col] = values.str.upper().replace("", "UNKNOWN")
+        return pd.DataFrame(keys, index=data.index)
+
+    @staticmethod
+    def save_partitioned_outputs(partitions, output_folder, output_types, csv_compression=None, progress=None):
+        """Write one file per partition (key -> ChunkSource) and output type, with parallel writers."""
+        partition_folder = os.path.join(output_folder, "output_partitions")
+        if not os.path.exists(partition_folder):
+            os.makedirs(partition_folder)
+
+        output_files = {}
+        # Names already given out, compared case-insensitively as Windows and macOS file systems do
+        taken = set()
+        with ThreadPoolExecutor(max_workers=os.cpu_count() or 1) as pool:
+            futures = []
+            for key in sorted(partitions):
+                base = "_".join(re.sub(r"[^\w.-]", "_", str(part)) for part in key)
+                # Keys such as 'ca 1.csv' and 'ca_1.csv' clean up to the same name; number the later ones
+                name, suffix = base, 2
+                while name.lower() in taken:
+                    name, suffix = f"{base}_{suffix}", suffix + 1
+                taken.add(name.lower())
+                for output_type in output_types:
+                    output_file = os.path.join(
+                        partition_folder, f"output_{name}.{DataProcessor.OUTPUT_EXTENSIONS[output_type]}")
+                    output_files[(key, output_type)] = DataProcessor.written_path(output_file, output_type,
+                                                                                  csv_compression)
+                    futures.append(pool.submit(DataProcessor.save_source, partitions[key], output_file, output_type,
+                                               csv_compression, progress))
+            DataProcessor.wait_all(futures, output_files.values())
+        return output_files
+
+    @staticmethod
+    def wait_all(futures, output_files):
+        """Wait for writer tasks; if any fails, drop the queued ones and remove every file they were writing."""
+        try:
+            for future in futures:
+                future.result()
+        except BaseException:
+            for future in futures:
+                future.cancel()
+            # Writers still running stop at their next chunk when the run was cancelled
+            wait(futures)
+            DataProcessor.remove_files(output_files)
+            raise
+
+    @staticmethod
+    def remove_files(paths):
+        for path in paths:
+            if os.path.exists(path):
+                os.remove(path)
+
+    @staticmethod
+    def save_output(data_frame, output_file, output_type, csv_compression=None, progress=None):
+        DataProcessor.save_source(DataProcessor.frame_source(data_frame), output_file, output_type, csv_compression,
+                                  progress)
+
+    @staticmethod
+    def save_source(rows, output_file, output_type, csv_compression=None, progress=None):
+        """Stream the rows of a ChunkSource into one output file."""
+        chunks = DataProcessor.counted(rows.chunks(), progress)
         if output_type == 'Excel':
-            data_frame.to_excel(output_file, index=False)
+            with ExcelStreamWriter(output_file, rows.columns) as writer:
+                for chunk in chunks:
+                    writer.write_chunk(chunk)
         elif output_type == 'CSV':
-            data_frame.to_csv(output_file, index=False)
+            CsvStreamWriter.write(chunks, rows.columns, output_file, csv_compression)
         elif output_type == 'PDF':
-            DataProcessor.convert_to_pdf(data_frame, output_file)
-
-    @staticmethod
-    def convert_to_pdf(data_frame, output_file):
-        pdf_file = f"{output_file}.pdf"
-        col_widths = [max(len(str(col)) * 0.15 * inch, 1 * inch) for col in data_frame.columns]
-        total_width = sum(col_widths)
-
-        doc = SimpleDocTemplate(pdf_file, pagesize=(total_width, letter[1]))
-        data = [data_frame.columns.tolist()] + data_frame.astype(str).values.tolist()
-        table = Table(data, colWidths=col_widths)
-        table.setStyle(TableStyle([
-            ('BACKGROUND', (0, 0), (-1, 0), colors.grey),
-            ('TEXTCOLOR', (0, 0), (-1, 0), colors.whitesmoke),
-            ('ALIGN', (0, 0), (-1, -1), 'CENTER'),
-            ('FONTNAME', (0, 0), (-1, 0), 'Helvetica-Bold'),
-            ('BOTTOMPADDING', (0, 0), (-1, 0), 12),
-            ('GRID', (0, 0), (-1, -1), 1, colors.black),
-        ]))
-        doc.build([table])
-        print(f"Converted to PDF: {pdf_file}")
+            pages = None
+            if progress:
+                # Restart the page count now, so the rate covers this document's whole render
+                progress.update("render", 0)
+                pages = lambda done, total: progress.update("render", done, total)
+            PdfReportWriter.write_chunks(chunks, rows.columns, rows.rows, output_file, progress=pages)
+            print(f"Converted to PDF: {output_file}")
+        elif output_type in ('Parquet', 'Feather'):
+            ColumnarWriter.write(chunks, rows.columns, output_file, output_type)
 
+    @staticmethod
+    def convert_to_pdf(data_frame, output_file, progress=None):
+        PdfReportWriter.write(data_frame, output_file, progress=progress)
+        print(f"Converted to PDF: {output_file}")
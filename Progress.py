@@ -0,0 +1,136 @@
+import threading
+import time
+from collections import namedtuple
+
+# rate is units per second since the stage started; eta is seconds left, None while unknown
+ProgressEvent = namedtuple("ProgressEvent", ["stage", "label", "done", "total", "rate", "eta"])
+# The first rows of a run's result as text, published as soon as the survivors are known
+PreviewRows = namedtuple("PreviewRows", ["columns", "rows", "total"])
+
+
+class JobCancelled(Exception):
+    """Raised inside a run at its next checkpoint once its CancelToken is set."""
+
+
+class CancelToken:
+    """Cooperative cancellation flag, set from any thread and checked by the run between chunks."""
+
+    def __init__(self, event=None):
+        # A multiprocessing.Event works too, for a run in another process
+        self.event = event if event is not None else threading.Event()
+
+    def cancel(self):
+        self.event.set()
+
+    @property
+    def cancelled(self):
+        return self.event.is_set()
+
+    def check(self):
+        if self.event.is_set():
+            raise JobCancelled("Processing cancelled")
+
+
+class ProgressReporter:
+    """Publish per-stage progress of a run as ProgressEvents on a thread-safe queue.
+
+    Counting is cheap and lock-protected, so worker threads can report from their loops;
+    events are only queued every min_interval seconds per stage, plus at the start and end.
+    Without a queue the reporter only counts, which keeps headless runs free of it.
+
+    Every report is also a cancellation checkpoint: with a CancelToken, start, advance and update
+    raise JobCancelled once it is set, so stages stop at their next chunk or block boundary.
+    """
+
+    LABELS = {
+        "load": "Loading files",
+        "normalize": "Normalizing rows",
+        "map": "Partitioning files",
+        "compare": "Comparing blocks",
+        "write": "Writing rows",
+        "render": "Rendering PDF pages",
+    }
+    MIN_INTERVAL = 0.25
+
+    def __init__(self, events=None, min_interval=MIN_INTERVAL, cancel=None):
+        self.events = events
+        self.cancel = cancel
+        self.min_interval = min_interval
+        self.lock = threading.Lock()
+        # stage -> [started, done, total, last published]
+        self.stages = {}
+        # stage -> seconds from start to finish, for run reports
+        self.durations = {}
+
+    def checkpoint(self):
+        if self.cancel is not None:
+            self.cancel.check()
+
+    def start(self, stage, total=None):
+        self.checkpoint()
+        with self.lock:
+            self.stages[stage] = [time.monotonic(), 0, total, 0.0]
+            event = self.event(stage, force=True)
+        self.publish(event)
+
+    def advance(self, stage, count=1):
+        self.checkpoint()
+        with self.lock:
+            self.stages[stage][1] += count
+            event = self.event(stage)
+        self.publish(event)
+
+    def update(self, stage, done, total=None):
+        """Set an absolute count, for callers that report 'n of total' rather than increments."""
+        self.checkpoint()
+        with self.lock:
+            state = self.stages.setdefault(stage, [time.monotonic(), 0, total, 0.0])
+            if done < state[1]:
+                # Counting started over (the next PDF of a partitioned run); so does the rate
+                state[0], state[2] = time.monotonic(), None
+            state[1] = done
+            if total is not None:
+                state[2] = total
+            event = self.event(stage)
+        self.publish(event)
+
+    def finish(self, stage):
+        with self.lock:
+            state = self.stages[stage]
+            if state[2] is None:
+                state[2] = state[1]
+            state[1] = state[2]
+            self.durations[stage] = time.monotonic() - state[0]
+            event = self.event(stage, force=True)
+        self.publish(event)
+
+    def event(self, stage, force=False):
+        """Snapshot of a stage, or None when the last one went out less than min_interval ago."""
+        started, done, total, published = self.stages[stage]
+        now = time.monotonic()
+        if self.events is None or not (force or done == total or now - published >= self.min_interval):
+            return None
+        self.stages[stage][3] = now
+        elapsed = now - started
+        rate = done / elapsed if elapsed > 0 else 0.0
+        eta = (total - done) / rate if total is not None and rate > 0 else None
+        return ProgressEvent(stage, ProgressReporter.LABELS.get(stage, stage), done, total, rate, eta)
+
+    def preview(self, columns, rows, total):
+        """Queue the first result rows (lists of strings) for display while the outputs are written."""
+        self.publish(PreviewRows(list(columns), rows, total) if self.events is not None else None)
+
+    def publish(self, event):
+        if event is not None:
+            self.events.put(event)
+
+    @staticmethod
+    def describe(event):
+        """One line for a status label, e.g. 'Writing rows: 50,000 / 120,000 (41,000/s, 2s left)'."""
+        text = f"{event.label}: {event.done:,}"
+        if event.total is not None:
+            text += f" / {event.total:,}"
+        details = [f"{event.rate:,.0f}/s"] if event.rate else []
+        if event.eta is not None and event.done < (event.total or 0):
+            details.append(f"{event.eta:.0f}s left")
+        return text + (f" ({', '.join(details)})" if details else "")
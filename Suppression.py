@@ -0,0 +1,100 @@
+import os
+
+import numpy as np
+import pandas as pd
+
+from ColumnProfiler import ColumnProfiler
+from ContactSets import ContactSets
+from DedupIndex import DedupIndex
+
+
+class SuppressionList:
+    """Phones that must never be exported again (DNC lists, already-dispositioned leads)."""
+
+    # Dispositions that usually go on the list; pass them to process_files as suppressed_statuses
+    COMMON_STATUSES = ("DNC", "Not interested", "Wrong number")
+    STATUS_COLUMNS = ("Status", "Original Status")
+
+    # Sorted phone arrays already loaded this session, keyed by the files and their modification times
+    _session_cache = {}
+    # The same per file, so a changed selection only rereads the files it adds
+    _file_cache = {}
+
+    @staticmethod
+    def phone_numbers(values):
+        """Normalize phones to int64 (last 10 digits); anything that is not a full number becomes -1."""
+        digits = DedupIndex.normalize_phones(ContactSets.as_text(pd.Series(values, dtype=object)))
+        numbers = pd.to_numeric(digits.where(digits.str.len() == 10), errors="coerce")
+        return numbers.fillna(-1).to_numpy(dtype=np.int64)
+
+    @staticmethod
+    def read_phones(path):
+        """Every phone number in a suppression file; files with phone-like columns contribute only those."""
+        if path.endswith(".xlsx"):
+            data = pd.read_excel(path, dtype=str)
+        else:
+            data = pd.read_csv(path, header=None if path.endswith(".txt") else "infer", dtype=str)
+        profile = ColumnProfiler.profile_columns(data)
+        columns = [col for col, content_type in profile.items() if content_type == "Phone"]
+        values = data[columns or list(data.columns)].to_numpy(dtype=object).ravel()
+        numbers = SuppressionList.phone_numbers(values)
+        return np.unique(numbers[numbers >= 0])
+
+    @staticmethod
+    def load_file(path):
+        """Sorted unique phones of one file, kept in memory until the file changes.
+
+        Nothing is written next to the list: it may sit in a read-only or shared folder.
+        """
+        key = (os.path.abspath(path), os.path.getmtime(path), os.path.getsize(path))
+        if key not in SuppressionList._file_cache:
+            SuppressionList._file_cache[key] = SuppressionList.read_phones(path)
+        return SuppressionList._file_cache[key]
+
+    @staticmethod
+    def load(paths):
+        """One sorted array of all suppressed phones, built once per session for the same files."""
+        key = tuple((path, os.path.getmtime(path)) for path in sorted(paths))
+        if key not in SuppressionList._session_cache:
+            arrays = [SuppressionList.load_file(path) for path in sorted(paths)]
+            phones = np.unique(np.concatenate(arrays)) if arrays else np.empty(0, dtype=np.int64)
+            SuppressionList._session_cache[key] = phones
+        return SuppressionList._session_cache[key]
+
+    @staticmethod
+    def contains(phones, numbers):
+        """Vectorized membership of numbers in the sorted phones array via binary search."""
+        if len(phones) == 0:
+            return np.zeros(numbers.shape, dtype=bool)
+        positions = np.searchsorted(phones, numbers).clip(max=len(phones) - 1)
+        return phones[positions] == numbers
+
+    @staticmethod
+    def status_mask(data, statuses):
+        """Rows whose disposition contains any of the given statuses, compared like preprocessed text."""
+        mask = np.zeros(len(data), dtype=bool)
+        columns = [col for col in SuppressionList.STATUS_COLUMNS if col in data.columns]
+        if not statuses or not columns:
+            return mask
+        # Same normalization as DataProcessor.preprocess_data: lowercase, no punctuation or spaces
+        patterns = pd.Series(list(statuses)).str.lower().str.replace(r"[^\w]|\s", "", regex=True)
+        patterns = patterns[patterns != ""]
+        if patterns.empty:
+            # An empty pattern would be contained in every status
+            return mask
+        pattern = "|".join(patterns)
+        for col in columns:
+            text = data[col].astype("string").fillna("").str.lower().str.replace(r"[^\w]|\s", "", regex=True)
+            mask |= text.str.contains(pattern, regex=True).to_numpy(dtype=bool)
+        return mask
+
+    @staticmethod
+    def suppressed_rows(data, phone_columns, paths=(), statuses=()):
+        """Boolean mask of rows holding a suppressed phone in any slot or a suppressed status."""
+        mask = SuppressionList.status_mask(data, statuses)
+        if paths and phone_columns:
+            phones = SuppressionList.load(paths)
+            numbers = SuppressionList.phone_numbers(data[phone_columns].to_numpy(dtype=object).ravel())
+            hits = SuppressionList.contains(phones, numbers).reshape(len(data), len(phone_columns))
+            mask |= hits.any(axis=1)
+        return mask
@@ -0,0 +1,251 @@
+import multiprocessing
+import os
+import queue
+from collections import deque, namedtuple
+
+from Loaders import ModuleLoader
+from Progress import CancelToken, JobCancelled, PreviewRows, ProgressReporter
+
+
+class JobEvents:
+    """Queue-like adapter that tags one job's ProgressEvents and PreviewRows for the worker's message queue."""
+
+    def __init__(self, messages, job_id):
+        self.messages = messages
+        self.job_id = job_id
+
+    def put(self, event):
+        self.messages.put(("preview" if isinstance(event, PreviewRows) else "progress", self.job_id, event))
+
+
+class PipelineWorker:
+    """Long-lived subprocess running DataProcessor jobs, so processing never holds the GUI's GIL.
+
+    Jobs go in as (job_id, file_paths, output_folder, output_types, options, preview_file). Messages
+    come back as (kind, job_id, payload): ("ready", None, import report) once the worker has loaded
+    the pipeline, ("progress", job_id, ProgressEvent), ("preview", job_id, PreviewRows),
+    ("result", job_id, ProcessingResult fields as a dict), ("preview_file", job_id, path) once the
+    preview file is written, ("cancelled", job_id, None) and ("error", job_id, message). The process
+    stays up between jobs, so the interpreter start and the pandas import are paid once.
+    """
+
+    def __init__(self):
+        # spawn everywhere: a fork of the Tk process would inherit its window state
+        self.context = multiprocessing.get_context("spawn")
+        self.jobs = self.context.Queue()
+        self.messages = self.context.Queue()
+        self.cancel_event = self.context.Event()
+        self.process = None
+        self.last_job = 0
+
+    def start(self):
+        """Start the worker process unless it is already running."""
+        if self.process is None or not self.process.is_alive():
+            # Not a daemon: PDF output renders pages in its own pool of child processes
+            self.process = self.context.Process(target=PipelineWorker.serve, name="pipeline-worker",
+                                                args=(self.jobs, self.messages, self.cancel_event))
+            self.process.start()
+
+    def alive(self):
+        return self.process is not None and self.process.is_alive()
+
+    def submit(self, file_paths, output_folder, output_types, preview_file=None, job_id=None, **options):
+        """Queue a job with its own copies of the inputs; returns its job id.
+
+        With preview_file, the whole result is also written there as uncompressed Feather after the
+        result is reported, for the GUI to memory-map.
+        """
+        self.start()
+        self.last_job = job_id if job_id is not None else self.last_job + 1
+        self.cancel_event.clear()
+        self.jobs.put((self.last_job, list(file_paths), output_folder, list(output_types), dict(options),
+                       preview_file))
+        return self.last_job
+
+    def cancel(self):
+        """Ask the running job to stop at its next checkpoint."""
+        self.cancel_event.set()
+
+    def poll(self):
+        """Every message that arrived since the last poll, without blocking."""
+        messages = []
+        while True:
+            try:
+                messages.append(self.messages.get_nowait())
+            except queue.Empty:
+                return messages
+
+    def stop(self, timeout=5):
+        """Cancel the current job and let the worker exit; terminate it if it does not in time."""
+        if self.alive():
+            self.cancel_event.set()
+            self.jobs.put(None)
+            self.process.join(timeout)
+            if self.process.is_alive():
+                self.process.terminate()
+        self.process = None
+
+    @staticmethod
+    def serve(jobs, messages, cancel_event):
+        """Worker process main loop: warm up once, then run jobs until the None sentinel or the parent exits."""
+        ModuleLoader.warm_up().join()
+        DataProcessor = ModuleLoader.module("Processor").DataProcessor
+        ColumnarWriter = ModuleLoader.module("Writers").ColumnarWriter
+        messages.put(("ready", None, ModuleLoader.report()))
+
+        parent = multiprocessing.parent_process()
+        while True:
+            try:
+                job = jobs.get(timeout=1.0)
+            except queue.Empty:
+                # A parent killed without stop() (a terminated service, say) must not leave the worker behind
+                if parent is not None and not parent.is_alive():
+                    return
+                continue
+            if job is None:
+                return
+            job_id, file_paths, output_folder, output_types, options, preview_file = job
+            progress = ProgressReporter(JobEvents(messages, job_id), cancel=CancelToken(cancel_event))
+            try:
+                result = DataProcessor.run(file_paths, output_folder, output_types, progress=progress, **options)
+                # The rows stay here; the GUI only needs the counts and the written files, and a plain
+                # dict unpickles there without importing the pipeline
+                messages.put(("result", job_id, dict(result._asdict(), data=None)))
+            except JobCancelled:
+                messages.put(("cancelled", job_id, None))
+                continue
+            except Exception as e:
+                messages.put(("error", job_id, str(e)))
+                continue
+            # The job is done and its slot free already; a failed preview only leaves the streamed rows
+            if preview_file and ColumnarWriter.available():
+                try:
+                    ColumnarWriter.write_preview(result.data, preview_file)
+                except (OSError, ValueError):
+                    continue
+                messages.put(("preview_file", job_id, preview_file))
+
+
+# One submission, fixed when it is queued; options is a sorted tuple of (name, value) pairs
+Job = namedtuple("Job", ["job_id", "file_paths", "output_folder", "output_types", "options", "preview_file"])
+
+
+class JobQueue:
+    """Jobs run on a bounded pool of warm PipelineWorkers, one job per worker at a time.
+
+    Each job also fans out to writer threads and PDF processes, so by default only half the cores
+    get a worker. A queued job also waits while the running ones' estimated memory (input size times
+    MEMORY_FACTOR) plus its own would exceed MEMORY_SHARE of physical memory; with nothing running
+    it starts regardless, however large.
+    """
+
+    MEMORY_FACTOR = 10
+    MEMORY_SHARE = 0.5
+    # Status of a job by its final message
+    FINAL_STATUS = {"result": "done", "cancelled": "cancelled", "error": "error"}
+
+    def __init__(self, max_workers=None):
+        self.max_workers = max_workers or max((os.cpu_count() or 2) // 2, 1)
+        memory = JobQueue.physical_memory()
+        self.memory_budget = memory * JobQueue.MEMORY_SHARE if memory else None
+        self.workers = []
+        # job_id -> (worker, job) while running
+        self.running = {}
+        self.pending = deque()
+        # job_id -> "queued", "running", "done", "cancelled" or "error"
+        self.status = {}
+        self.jobs = {}
+        self.last_job = 0
+        # Messages for jobs that never reached a worker
+        self.notices = []
+
+    @staticmethod
+    def physical_memory():
+        try:
+            return os.sysconf("SC_PAGE_SIZE") * os.sysconf("SC_PHYS_PAGES")
+        except (AttributeError, ValueError, OSError):
+            # Not available on Windows; concurrency is then bounded by the worker count alone
+            return None
+
+    @staticmethod
+    def estimate_memory(job):
+        return JobQueue.MEMORY_FACTOR * sum(os.path.getsize(path) for path in job.file_paths if os.path.exists(path))
+
+    def warm_up(self):
+        """Start the first worker ahead of the first job."""
+        if not self.workers:
+            self.workers.append(PipelineWorker())
+            self.workers[0].start()
+
+    def submit(self, file_paths, output_folder, output_types, preview_file=None, **options):
+        """Queue a job with its own frozen copy of the inputs and options; returns its job id."""
+        self.last_job += 1
+        job = Job(self.last_job, tuple(file_paths), output_folder, tuple(output_types),
+                  tuple(sorted(options.items())), preview_file)
+        self.jobs[job.job_id] = job
+        self.status[job.job_id] = "queued"
+        self.pending.append(job)
+        self.dispatch()
+        return job.job_id
+
+    def memory_in_use(self):
+        return sum(JobQueue.estimate_memory(job) for _, job in self.running.values())
+
+    def idle_worker(self):
+        busy = [worker for worker, _ in self.running.values()]
+        for worker in self.workers:
+            if not any(worker is other for other in busy):
+                return worker
+        worker = PipelineWorker()
+        self.workers.append(worker)
+        return worker
+
+    def dispatch(self):
+        """Start queued jobs, in order, while a worker slot and the memory budget allow."""
+        while self.pending and len(self.running) < self.max_workers:
+            job = self.pending[0]
+            if self.running and self.memory_budget is not None and \
+                    self.memory_in_use() + JobQueue.estimate_memory(job) > self.memory_budget:
+                break
+            self.pending.popleft()
+            worker = self.idle_worker()
+            worker.submit(job.file_paths, job.output_folder, job.output_types, job.preview_file, job.job_id,
+                          **dict(job.options))
+            self.running[job.job_id] = (worker, job)
+            self.status[job.job_id] = "running"
+
+    def cancel(self, job_id):
+        """Drop a queued job, or ask a running one to stop at its next checkpoint."""
+        job = next((job for job in self.pending if job.job_id == job_id), None)
+        if job is not None:
+            self.pending.remove(job)
+            self.status[job_id] = "cancelled"
+            self.notices.append(("cancelled", job_id, None))
+        elif job_id in self.running:
+            self.running[job_id][0].cancel()
+
+    def poll(self):
+        """Messages from every worker, as (kind, job_id, payload); finished jobs make room for queued ones.
+
+        A queued job cancelled before it started gets its ("cancelled", job_id, None) here too.
+        """
+        messages, self.notices = self.notices, []
+        for worker in list(self.workers):
+            for kind, job_id, payload in worker.poll():
+                messages.append((kind, job_id, payload))
+                if kind in JobQueue.FINAL_STATUS:
+                    self.status[job_id] = JobQueue.FINAL_STATUS[kind]
+                    self.running.pop(job_id, None)
+        for job_id, (worker, _) in list(self.running.items()):
+            if not worker.alive():
+                messages.append(("error", job_id, "the worker process stopped unexpectedly"))
+                self.status[job_id] = "error"
+                del self.running[job_id]
+                self.workers.remove(worker)
+        self.dispatch()
+        return messages
+
+    def stop(self):
+        for worker in self.workers:
+            worker.stop()
+        self.workers = []
@@ -0,0 +1,453 @@
+import math
+import multiprocessing
+import os
+import tempfile
+import threading
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, wait
+from concurrent.futures.process import BrokenProcessPool
+
+import numpy as np
+import pandas as pd
+import xlsxwriter
+from reportlab.lib import colors
+from reportlab.lib.pagesizes import letter
+from reportlab.lib.units import inch
+from reportlab.pdfgen import canvas
+from reportlab.platypus import Table, TableStyle
+
+try:
+    from pypdf import PdfWriter
+except ImportError:
+    # Without pypdf the pages are rendered in-process onto a single canvas
+    PdfWriter = None
+
+try:
+    import pyarrow as pa
+    import pyarrow.compute as pa_compute
+    import pyarrow.csv as pa_csv
+    import pyarrow.feather as pa_feather
+    import pyarrow.ipc as pa_ipc
+    import pyarrow.parquet as pa_parquet
+except ImportError:
+    # Without pyarrow CSV output falls back to DataFrame.to_csv; Parquet and Feather need it
+    pa = None
+
+
+class ExcelStreamWriter:
+    """Write an .xlsx row chunk by row chunk in xlsxwriter's constant-memory mode."""
+
+    # Excel's hard limit per sheet, header row included
+    MAX_SHEET_ROWS = 1_048_576
+    # Rows used to size the columns, and the widest a column may get
+    WIDTH_SAMPLE_ROWS = 1000
+    MAX_COLUMN_WIDTH = 50
+
+    def __init__(self, output_file, columns, sheet_name="Sheet"):
+        self.columns = [str(col) for col in columns]
+        self.sheet_name = sheet_name
+        # Text is written as text: no formula, URL or number guessing on lead data
+        self.workbook = xlsxwriter.Workbook(output_file, {
+            "constant_memory": True,
+            "strings_to_formulas": False,
+            "strings_to_urls": False,
+            "strings_to_numbers": False,
+        })
+        self.header_format = self.workbook.add_format({"bold": True})
+        self.widths = None
+        self.worksheet = None
+        self.sheet_count = 0
+        self.sheet_row = 0
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+    @staticmethod
+    def column_widths(chunk, columns, sample_rows=WIDTH_SAMPLE_ROWS, max_width=MAX_COLUMN_WIDTH):
+        """Width per column from the header and the first sampled rows, not from every cell."""
+        sample = chunk.head(sample_rows)
+        widths = []
+        for position, col in enumerate(columns):
+            values = sample.iloc[:, position].dropna().astype(str)
+            longest = int(values.str.len().max()) if not values.empty else 0
+            widths.append(min(max(longest, len(col)) + 2, max_width))
+        return widths
+
+    def add_sheet(self):
+        """Start the next sheet; in constant-memory mode widths must be set before any row is written."""
+        self.sheet_count += 1
+        name = self.sheet_name if self.sheet_count == 1 else f"{self.sheet_name} {self.sheet_count}"
+        self.worksheet = self.workbook.add_worksheet(name)
+        for position, width in enumerate(self.widths):
+            self.worksheet.set_column(position, position, width)
+        self.worksheet.write_row(0, 0, self.columns, self.header_format)
+        self.sheet_row = 1
+
+    def write_chunk(self, chunk):
+        """Append a DataFrame chunk; nulls become blank cells and full sheets roll over to a new one."""
+        if self.widths is None:
+            self.widths = ExcelStreamWriter.column_widths(chunk, self.columns)
+        # Converting one chunk at a time keeps the copy bounded by the chunk size
+        rows = chunk.astype(object).where(chunk.notna(), None).itertuples(index=False, name=None)
+        for row in rows:
+            if self.worksheet is None or self.sheet_row >= ExcelStreamWriter.MAX_SHEET_ROWS:
+                self.add_sheet()
+            self.worksheet.write_row(self.sheet_row, 0, row)
+            self.sheet_row += 1
+
+    def close(self):
+        if self.worksheet is None:
+            # An empty result still gets a sheet with the header
+            self.widths = self.widths or [len(col) + 2 for col in self.columns]
+            self.add_sheet()
+        self.workbook.close()
+
+
+class CsvStreamWriter:
+    """Write CSV through Arrow's columnar encoder, chunk by chunk, optionally compressed."""
+
+    COMPRESSION_SUFFIXES = {None: "", "gzip": ".gz", "zstd": ".zst"}
+    THREADS = os.cpu_count() or 1
+
+    @staticmethod
+    def output_path(output_file, compression=None):
+        if compression not in CsvStreamWriter.COMPRESSION_SUFFIXES:
+            raise ValueError(f"Unsupported CSV compression: {compression}")
+        return output_file + CsvStreamWriter.COMPRESSION_SUFFIXES[compression]
+
+    @staticmethod
+    def as_text_columns(chunk):
+        """Mixed-type object columns (ints next to strings) are encoded as strings; nulls stay null."""
+        text = {col: chunk[col].where(chunk[col].isna(), chunk[col].astype(str))
+                for col in chunk.columns if chunk[col].dtype == object}
+        return chunk.assign(**text) if text else chunk
+
+    @staticmethod
+    def arrow_schema(chunk):
+        """Schema for every chunk of the frame; text columns are strings even when a chunk is all null."""
+        # Arrow fields are looked up by name, so a repeated label would silently take the wrong column
+        repeated = chunk.columns[chunk.columns.duplicated()]
+        if len(repeated):
+            raise ValueError(f"Repeated column names in output: {', '.join(map(str, dict.fromkeys(repeated)))}")
+        schema = pa.Schema.from_pandas(chunk, preserve_index=False)
+        for col in chunk.columns:
+            if chunk[col].dtype == object:
+                position = schema.get_field_index(str(col))
+                schema = schema.set(position, pa.field(str(col), pa.string()))
+        return schema
+
+    @staticmethod
+    def to_arrow(chunk, schema, threads=THREADS):
+        return pa.Table.from_pandas(chunk, schema=schema, preserve_index=False, nthreads=threads)
+
+    @staticmethod
+    def write(chunks, columns, output_file, compression=None):
+        """Stream DataFrame chunks to output_file (plus .gz/.zst); nulls are written as empty fields."""
+        output_file = CsvStreamWriter.output_path(output_file, compression)
+        header = ",".join(f'"{col}"' for col in columns) + "\n"
+        if pa is None:
+            mode = "w"
+            for chunk in chunks:
+                chunk.to_csv(output_file, mode=mode, header=mode == "w", index=False, compression=compression)
+                mode = "a"
+            if mode == "w":
+                # Nothing was written; leave a header-only file
+                pd.DataFrame(columns=columns).to_csv(output_file, index=False, compression=compression)
+            return output_file
+
+        stream = pa.CompressedOutputStream(output_file, compression) if compression else pa.OSFile(output_file, "wb")
+        writer = None
+        try:
+            for chunk in chunks:
+                chunk = CsvStreamWriter.as_text_columns(chunk)
+                if writer is None:
+                    schema = CsvStreamWriter.arrow_schema(chunk)
+                    writer = pa_csv.CSVWriter(stream, schema)
+                writer.write_table(CsvStreamWriter.to_arrow(chunk, schema))
+            if writer is None:
+                stream.write(header.encode())
+        finally:
+            if writer is not None:
+                writer.close()
+            stream.close()
+        return output_file
+
+
+class ColumnarWriter:
+    """Stream chunks into Parquet row groups or Feather (Arrow IPC) record batches."""
+
+    PARQUET_COMPRESSION = "zstd"
+    FEATHER_COMPRESSION = "lz4"
+    # Feather text columns with at most this share of distinct values in the first chunk are
+    # dictionary-encoded; near-unique ones (names, phones) gain nothing from it and stay plain
+    DICTIONARY_MAX_SHARE = 0.5
+
+    @staticmethod
+    def available():
+        return pa is not None
+
+    @staticmethod
+    def is_text(field):
+        return pa.types.is_string(field.type) or pa.types.is_large_string(field.type)
+
+    @staticmethod
+    def dictionary_schema(schema, chunk, max_share=DICTIONARY_MAX_SHARE):
+        """The same schema with the string columns that repeat their values in chunk dictionary-encoded."""
+        for position, field in enumerate(schema):
+            values = chunk[field.name] if field.name in chunk.columns else None
+            if ColumnarWriter.is_text(field) and values is not None \
+                    and values.nunique() <= max_share * max(values.count(), 1):
+                schema = schema.set(position, field.with_type(pa.dictionary(pa.int32(), pa.string())))
+        return schema
+
+    @staticmethod
+    def encode(array, dictionary, codes):
+        """Dictionary-encode against a growing dictionary; new values are appended, never reordered.
+
+        Feather files allow one dictionary per column, extended by deltas only, so each batch's
+        dictionary has to start with the previous one. codes maps every value already in the
+        dictionary to its position, so a chunk only looks up its own distinct values.
+        """
+        local, uniques = pd.factorize(array.to_numpy(zero_copy_only=False))
+        found = np.fromiter((codes.get(value, -1) for value in uniques), dtype=np.int64, count=len(uniques))
+        new = np.flatnonzero(found < 0)
+        if len(new):
+            found[new] = np.arange(len(codes), len(codes) + len(new))
+            codes.update(zip(uniques[new].tolist(), found[new].tolist()))
+            dictionary = pa.concat_arrays([dictionary, pa.array(uniques[new], pa.string())])
+        missing = local < 0
+        indices = pa.array(np.where(missing, 0, found[local]).astype(np.int32), mask=missing)
+        return pa.DictionaryArray.from_arrays(indices, dictionary), dictionary
+
+    @staticmethod
+    def write_preview(data_frame, output_file):
+        """Write data_frame as an uncompressed Feather file of plain columns, for reading through a memory map.
+
+        Compressed or dictionary-encoded batches are decoded when read; these are used in place.
+        """
+        if pa is None:
+            raise ValueError("Feather output needs pyarrow")
+        data_frame = CsvStreamWriter.as_text_columns(data_frame)
+        table = CsvStreamWriter.to_arrow(data_frame, CsvStreamWriter.arrow_schema(data_frame))
+        pa_feather.write_feather(table, output_file, compression="uncompressed")
+        return output_file
+
+    @staticmethod
+    def write(chunks, columns, output_file, output_type):
+        """Write 'Parquet' (one row group per chunk) or 'Feather' with a schema stored in the file."""
+        if pa is None:
+            raise ValueError(f"{output_type} output needs pyarrow")
+        writer = None
+        dictionaries = {}
+        try:
+            for chunk in chunks:
+                chunk = CsvStreamWriter.as_text_columns(chunk)
+                if writer is None:
+                    # pandas metadata travels in the schema, so readers get the original dtypes back
+                    schema = CsvStreamWriter.arrow_schema(chunk)
+                    if output_type == "Parquet":
+                        writer = pa_parquet.ParquetWriter(output_file, schema, use_dictionary=True,
+                                                          compression=ColumnarWriter.PARQUET_COMPRESSION)
+                    else:
+                        options = pa_ipc.IpcWriteOptions(compression=ColumnarWriter.FEATHER_COMPRESSION,
+                                                         emit_dictionary_deltas=True)
+                        encoded_schema = ColumnarWriter.dictionary_schema(schema, chunk)
+                        writer = pa_ipc.new_file(output_file, encoded_schema, options=options)
+                        dictionaries = {field.name: pa.array([], pa.string()) for field in encoded_schema
+                                        if pa.types.is_dictionary(field.type)}
+                        codes = {name: {} for name in dictionaries}
+                table = CsvStreamWriter.to_arrow(chunk, schema)
+                if output_type == "Parquet":
+                    writer.write_table(table, row_group_size=max(len(table), 1))
+                    continue
+                arrays = []
+                for field in schema:
+                    array = table.column(field.name).combine_chunks()
+                    if field.name in dictionaries:
+                        array, dictionaries[field.name] = ColumnarWriter.encode(
+                            array.cast(pa.string()), dictionaries[field.name], codes[field.name])
+                    arrays.append(array)
+                writer.write_batch(pa.RecordBatch.from_arrays(arrays, schema=encoded_schema))
+            if writer is None:
+                # Nothing was written; leave a file with the columns and no rows
+                empty = pa.table({str(col): pa.array([], pa.string()) for col in columns})
+                if output_type == "Parquet":
+                    pa_parquet.write_table(empty, output_file)
+                else:
+                    with pa_ipc.new_file(output_file, empty.schema) as empty_writer:
+                        empty_writer.write_table(empty)
+        finally:
+            if writer is not None:
+                writer.close()
+        return output_file
+
+
+class PdfReportWriter:
+    """Render a result as fixed-size per-page tables, optionally in parallel page groups."""
+
+    ROWS_PER_PAGE = 40
+    ROW_HEIGHT = 18
+    MARGIN = 0.5 * inch
+    # Pages rendered by one worker task; the rows in flight are bounded by this times the workers
+    PAGES_PER_PART = 25
+    WORKERS = min(4, os.cpu_count() or 1)
+    # Renderer processes shared by every PDF written in this process, so concurrent writers (one per
+    # format or partition) never run more than WORKERS of them in all
+    pool = None
+    pool_size = 0
+    pool_lock = threading.Lock()
+
+    STYLE = TableStyle([
+        ('BACKGROUND', (0, 0), (-1, 0), colors.grey),
+        ('TEXTCOLOR', (0, 0), (-1, 0), colors.whitesmoke),
+        ('ALIGN', (0, 0), (-1, -1), 'CENTER'),
+        ('VALIGN', (0, 0), (-1, -1), 'MIDDLE'),
+        ('FONTNAME', (0, 0), (-1, 0), 'Helvetica-Bold'),
+        ('GRID', (0, 0), (-1, -1), 1, colors.black),
+    ])
+
+    @staticmethod
+    def column_widths(columns):
+        return [max(len(str(col)) * 0.15 * inch, 1 * inch) for col in columns]
+
+    @staticmethod
+    def page_size(col_widths):
+        return sum(col_widths) + 2 * PdfReportWriter.MARGIN, letter[1]
+
+    @staticmethod
+    def draw_pages(pdf_canvas, header, rows, col_widths):
+        """Draw rows onto the canvas as one small table per page, each repeating the header."""
+        width, height = PdfReportWriter.page_size(col_widths)
+        for start in range(0, max(len(rows), 1), PdfReportWriter.ROWS_PER_PAGE):
+            page_rows = [header] + rows[start:start + PdfReportWriter.ROWS_PER_PAGE]
+            table = Table(page_rows, colWidths=col_widths, rowHeights=PdfReportWriter.ROW_HEIGHT)
+            table.setStyle(PdfReportWriter.STYLE)
+            _, table_height = table.wrapOn(pdf_canvas, width, height)
+            table.drawOn(pdf_canvas, PdfReportWriter.MARGIN, height - PdfReportWriter.MARGIN - table_height)
+            pdf_canvas.showPage()
+
+    @staticmethod
+    def render_part(part_file, header, rows, col_widths):
+        """Worker task: render one group of pages to its own PDF file."""
+        pdf_canvas = canvas.Canvas(part_file, pagesize=PdfReportWriter.page_size(col_widths))
+        PdfReportWriter.draw_pages(pdf_canvas, header, rows, col_widths)
+        pdf_canvas.save()
+        return part_file
+
+    @staticmethod
+    def part_rows(chunks):
+        """Yield the rows of each page group as lists of strings, one group at a time, whatever the chunk sizes."""
+        rows_per_part = PdfReportWriter.ROWS_PER_PAGE * PdfReportWriter.PAGES_PER_PART
+        rows = []
+        for chunk in chunks:
+            start = 0
+            while start < len(chunk):
+                part = chunk.iloc[start:start + rows_per_part - len(rows)]
+                rows.extend(part.fillna("").astype(str).values.tolist())
+                start += len(part)
+                if len(rows) == rows_per_part:
+                    yield rows
+                    rows = []
+        if rows:
+            yield rows
+
+    @staticmethod
+    def render_pool():
+        """The shared renderer pool with WORKERS processes, started on first use or when WORKERS changed.
+
+        Its processes are spawned, not forked: writers run in threads, and a child forked while
+        another thread holds a lock would wait on that lock forever.
+        """
+        with PdfReportWriter.pool_lock:
+            if PdfReportWriter.pool is None or PdfReportWriter.pool_size != PdfReportWriter.WORKERS:
+                if PdfReportWriter.pool is not None:
+                    # Groups already queued on the old pool still finish
+                    PdfReportWriter.pool.shutdown(wait=False)
+                PdfReportWriter.pool = ProcessPoolExecutor(PdfReportWriter.WORKERS,
+                                                           mp_context=multiprocessing.get_context("spawn"))
+                PdfReportWriter.pool_size = PdfReportWriter.WORKERS
+            return PdfReportWriter.pool
+
+    @staticmethod
+    def drop_pool(pool):
+        """Forget a pool that broke (a renderer died), so the next document starts a new one."""
+        with PdfReportWriter.pool_lock:
+            if PdfReportWriter.pool is pool:
+                PdfReportWriter.pool = None
+
+    @staticmethod
+    def write(data_frame, output_file, workers=None, progress=None):
+        """Write data_frame to output_file; progress(pages_done, total_pages) is called as pages finish.
+
+        Page groups render on the shared pool of PdfReportWriter.WORKERS processes, read at call
+        time so a process can retune it; workers (by default the same) bounds this document's share
+        of it, and 1 renders in-process.
+        """
+        return PdfReportWriter.write_chunks([data_frame], data_frame.columns, len(data_frame), output_file, workers,
+                                            progress)
+
+    @staticmethod
+    def write_chunks(chunks, columns, total_rows, output_file, workers=None, progress=None):
+        """Write DataFrame chunks holding total_rows rows in all, as write() does for one frame."""
+        workers = workers or PdfReportWriter.WORKERS
+        header = [str(col) for col in columns]
+        col_widths = PdfReportWriter.column_widths(header)
+        total_pages = max(math.ceil(total_rows / PdfReportWriter.ROWS_PER_PAGE), 1)
+        parts = PdfReportWriter.part_rows(chunks)
+        pages_per_part = PdfReportWriter.PAGES_PER_PART
+        report = progress or (lambda done, total: None)
+
+        if workers <= 1 or PdfWriter is None or total_pages <= pages_per_part:
+            pdf_canvas = canvas.Canvas(output_file, pagesize=PdfReportWriter.page_size(col_widths))
+            done = 0
+            for rows in parts:
+                PdfReportWriter.draw_pages(pdf_canvas, header, rows, col_widths)
+                done = min(done + pages_per_part, total_pages)
+                report(done, total_pages)
+            if total_rows == 0:
+                PdfReportWriter.draw_pages(pdf_canvas, header, [], col_widths)
+                report(1, 1)
+            pdf_canvas.save()
+            return output_file
+
+        folder = os.path.dirname(os.path.abspath(output_file))
+        pool = PdfReportWriter.render_pool()
+        with tempfile.TemporaryDirectory(dir=folder) as part_folder:
+            part_files, pending, done = [], set(), 0
+            try:
+                for number, rows in enumerate(parts):
+                    # Keep at most two groups per worker in flight so memory stays bounded
+                    while len(pending) >= 2 * workers:
+                        finished, pending = wait(pending, return_when=FIRST_COMPLETED)
+                        for future in finished:
+                            future.result()
+                        done = min(done + len(finished) * pages_per_part, total_pages)
+                        report(done, total_pages)
+                    part_file = os.path.join(part_folder, f"part_{number:06d}.pdf")
+                    part_files.append(part_file)
+                    pending.add(pool.submit(PdfReportWriter.render_part, part_file, header, rows, col_widths))
+                while pending:
+                    finished, pending = wait(pending, return_when=FIRST_COMPLETED)
+                    for future in finished:
+                        future.result()
+                    done = min(done + len(finished) * pages_per_part, total_pages)
+                    report(done, total_pages)
+            except BaseException as e:
+                # A failed part or a cancelled run (raised from report) drops the queued groups; the
+                # ones already rendering write into part_folder, so they finish before it is removed
+                for future in pending:
+                    future.cancel()
+                wait(pending)
+                if isinstance(e, BrokenProcessPool):
+                    PdfReportWriter.drop_pool(pool)
+                raise
+
+            merged = PdfWriter()
+            for part_file in part_files:
+                merged.append(part_file)
+            with open(output_file, "wb") as handle:
+                merged.write(handle)
+            merged.close()
+        return output_file
@@ -0,0 +1,168 @@
+"""Command-line batch runs, e.g. for the nightly job:
+
+    python cli.py "Data/*.csv" -o out -t CSV -t Parquet --report run.json
+    python cli.py --job arizona="Data/az_*.csv" --job california="Data/ca_*.csv" -o out --parallel 2
+    python cli.py "Data/*.csv" -o out -t CSV --partitions 8
+
+Each --job writes into its own folder under the output folder. The run report (JSON, on stdout
+unless --report names a file) has the timings and row counts of every job; the exit status is 1
+when any job failed.
+"""
+import argparse
+import contextlib
+import glob
+import json
+import os
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+from MapReduce import MapReduce
+from Processor import DataProcessor
+from Progress import ProgressReporter
+from Writers import PdfReportWriter
+
+
+def expand_globs(patterns):
+    """Sorted files matching any of the patterns, each once; a pattern matching nothing is an error."""
+    files = []
+    for pattern in patterns:
+        matches = sorted(glob.glob(os.path.expanduser(pattern)))
+        if not matches:
+            raise ValueError(f"No input files match {pattern}")
+        files.extend(path for path in matches if path not in files)
+    return files
+
+
+def parse_jobs(args):
+    """(name, files, output_folder) per job: the positional globs, and every --job NAME=GLOB[,GLOB...]."""
+    jobs = []
+    if args.inputs:
+        jobs.append(("default", expand_globs(args.inputs), args.output))
+    for spec in args.job:
+        name, _, patterns = spec.partition("=")
+        if not name or not patterns:
+            raise ValueError(f"Expected --job NAME=GLOB[,GLOB...], got {spec}")
+        jobs.append((name, expand_globs(patterns.split(",")), os.path.join(args.output, name)))
+    if not jobs:
+        raise ValueError("No input files given")
+    return jobs
+
+
+def run_job(name, files, output_folder, output_types, options, pdf_workers, partitions=0):
+    """Run one job (in a pool process) and describe it for the report; failures are reported, not raised.
+
+    With partitions, the job runs in map-reduce mode on that many hash partitions.
+    """
+    if pdf_workers:
+        PdfReportWriter.WORKERS = pdf_workers
+    progress = ProgressReporter()
+    started = time.time()
+    report = {"name": name, "files": files, "output_folder": output_folder}
+    try:
+        # Writer messages go to stderr, so stdout carries only the report
+        with contextlib.redirect_stdout(sys.stderr):
+            if partitions:
+                result = MapReduce.run(files, output_folder, output_types, partitions, progress=progress, **options)
+            else:
+                result = DataProcessor.run(files, output_folder, output_types, progress=progress, **options)
+        report.update(
+            status="done",
+            rows_loaded=result.rows_loaded,
+            rows_suppressed=result.rows_suppressed,
+            duplicates_count=result.duplicates_count,
+            rows_written=result.rows_written,
+            output_files=result.output_files,
+            partition_files=sorted(result.partition_files.values()),
+            clusters_file=result.clusters_file,
+            people_file=result.people_file,
+            links_file=result.links_file,
+            batch=result.batch,
+            processed_files=result.files,
+            warnings=result.warnings,
+        )
+    except Exception as e:
+        report.update(status="error", error=f"{type(e).__name__}: {e}")
+    report["seconds"] = round(time.time() - started, 3)
+    report["stage_seconds"] = {stage: round(seconds, 3) for stage, seconds in progress.durations.items()}
+    return report
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Combine lead files and remove duplicates without the GUI.")
+    parser.add_argument("inputs", nargs="*", help="input files or glob patterns (quote them), run as one job")
+    parser.add_argument("--job", action="append", default=[], metavar="NAME=GLOB[,GLOB...]",
+                        help="an extra independent job, written to OUTPUT/NAME; repeatable")
+    parser.add_argument("-o", "--output", required=True, help="output folder")
+    parser.add_argument("-t", "--output-type", action="append", choices=list(DataProcessor.OUTPUT_EXTENSIONS),
+                        help="output format; repeatable (default: Excel)")
+    parser.add_argument("--match-mode", default="subset", choices=["exact", "subset", "overlap"])
+    parser.add_argument("--workers", type=int, default=0, help="PDF rendering processes per job")
+    parser.add_argument("--parallel", type=int, default=1, help="jobs run at the same time")
+    parser.add_argument("--partitions", type=int, default=0, metavar="N",
+                        help="split each job into N hash partitions deduplicated on local processes")
+    parser.add_argument("--index", help="persistent dedup index (SQLite) shared across runs")
+    parser.add_argument("--incremental", action="store_true", help="skip files the index has already ingested")
+    parser.add_argument("--bloom-fp-rate", type=float, default=0.001,
+                        help="false-positive rate of the index's Bloom filter")
+    parser.add_argument("--suppress", action="append", default=[], metavar="FILE",
+                        help="suppression list of phones (DNC); repeatable")
+    parser.add_argument("--suppress-status", action="append", default=[], metavar="STATUS",
+                        help="drop rows with this disposition; repeatable")
+    parser.add_argument("--csv-compression", choices=["gzip", "zstd"])
+    parser.add_argument("--partition-by", action="append", choices=list(DataProcessor.PARTITION_COLUMNS),
+                        help="also write one file per partition; repeatable")
+    parser.add_argument("--zip-prefix", type=int, default=3)
+    parser.add_argument("--report", default="-", help="where to write the JSON run report (default: stdout)")
+    args = parser.parse_args(argv)
+
+    try:
+        jobs = parse_jobs(args)
+    except ValueError as e:
+        parser.error(str(e))
+    if args.partitions and args.index:
+        parser.error("--partitions cannot be combined with --index")
+
+    output_types = args.output_type or ["Excel"]
+    options = {
+        "match_mode": args.match_mode,
+        "suppression_paths": args.suppress,
+        "suppressed_statuses": args.suppress_status,
+        "csv_compression": args.csv_compression,
+        "partition_by": args.partition_by,
+        "zip_prefix": args.zip_prefix,
+    }
+    if not args.partitions:
+        options.update(index_path=args.index, incremental=args.incremental, bloom_fp_rate=args.bloom_fp_rate)
+    # Jobs sharing an index run one after another: each must see the keys the previous one added;
+    # partitioned jobs already spread over the cores, so they do too
+    parallel = 1 if args.index or args.partitions else max(args.parallel, 1)
+
+    started = time.time()
+    if parallel == 1 or len(jobs) == 1:
+        reports = [run_job(name, files, folder, output_types, options, args.workers, args.partitions)
+                   for name, files, folder in jobs]
+    else:
+        with ProcessPoolExecutor(min(parallel, len(jobs))) as pool:
+            futures = [pool.submit(run_job, name, files, folder, output_types, options, args.workers)
+                       for name, files, folder in jobs]
+            reports = [future.result() for future in futures]
+
+    run_report = {
+        "started": time.strftime("%Y-%m-%dT%H:%M:%S", time.localtime(started)),
+        "seconds": round(time.time() - started, 3),
+        "parallel": parallel,
+        "output_types": output_types,
+        "jobs": reports,
+    }
+    text = json.dumps(run_report, indent=2, default=str)
+    if args.report == "-":
+        print(text)
+    else:
+        with open(args.report, "w") as handle:
+            handle.write(text + "\n")
+    return 0 if all(report["status"] == "done" for report in reports) else 1
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -1,8 +1,16 @@
+import time
+
+# Startup is measured from here; the pipeline is loaded by the worker process after the window is up
+STARTED = time.perf_counter()
+
 import os
-import threading
+import shutil
+import tempfile
 from tkinter import filedialog
 import customtkinter as ctk
-from Processor import DataProcessor
+from Preview import FeatherRows, ListRows, PreviewGrid
+from Progress import ProgressReporter
+from Worker import JobQueue
 
 class App(ctk.CTk):
     def __init__(self):
@@ -17,10 +25,22 @@ class App(ctk.CTk):
         self.btn_toggle_theme = None
         self.label_file_2 = None
         self.btn_process = None
+        self.btn_cancel = None
+        # Submitted jobs run on a pool of worker processes; the selected one is shown below the buttons
+        self.jobs = JobQueue()
+        self.selected_job = None
+        self.frame_jobs = None
+        self.job_buttons = {}
+        self.job_text = {}
+        self.job_previews = {}
         self.animating = None
         self.file_paths = []
-        self.option_output_type = None
+        self.frame_output_types = None
+        self.output_type_checkboxes = {}
         self.label_result = None
+        self.preview_grid = None
+        # Memory-mapped copies of results for the preview; removed when the app closes
+        self.preview_folder = tempfile.mkdtemp(prefix="dedup-preview-")
         self.btn_select_file_1 = None
         self.btn_select_file_2 = None
 
@@ -61,10 +81,20 @@ class App(ctk.CTk):
         # Initial theme application
         self.apply_theme(self.current_theme)
 
+        # Idle callbacks run once the first frame is drawn
+        self.after_idle(self.start_warm_up)
+
     def configure_app(self):
-        self.geometry("500x400+100+100")
+        self.geometry("900x700+100+100")
         self.title("Duplicate Detection App")
         self.resizable(True, True)
+        self.protocol("WM_DELETE_WINDOW", self.on_close)
+
+    def start_warm_up(self):
+        """Report how long the window took to appear, then start the worker, which loads the pipeline."""
+        print(f"Window shown after {(time.perf_counter() - STARTED) * 1000:.0f} ms")
+        self.jobs.warm_up()
+        self.poll_jobs()
 
     def setup_toggle_theme_button(self):
         # Toggle theme button with animation phases
@@ -117,10 +147,17 @@ class App(ctk.CTk):
                                               text_color=self.current_theme["button_text"])
         self.btn_select_files.grid(row=5, column=0, pady=(10, 5), sticky="n")
 
-        # Output type selection
-        self.option_output_type = ctk.CTkComboBox(self.content_frame, values=["Excel", "CSV", "PDF"], width=150)
-        self.option_output_type.set("Excel")
-        self.option_output_type.grid(row=6, column=0, pady=(10, 10), sticky="n")
+        # Output type selection; every checked format is written from the same run
+        self.frame_output_types = ctk.CTkFrame(self.content_frame, fg_color=self.current_theme["bg"])
+        self.frame_output_types.grid(row=6, column=0, pady=(10, 10), sticky="n")
+        for column, output_type in enumerate(["Excel", "CSV", "PDF", "Parquet", "Feather"]):
+            checkbox = ctk.CTkCheckBox(self.frame_output_types, text=output_type, width=80,
+                                       fg_color=self.current_theme["button_bg"],
+                                       hover_color=self.current_theme["button_hover"],
+                                       text_color=self.current_theme["fg"])
+            checkbox.grid(row=0, column=column, padx=(5, 5))
+            self.output_type_checkboxes[output_type] = checkbox
+        self.output_type_checkboxes["Excel"].select()
 
         # Process button
         self.btn_process = ctk.CTkButton(self.content_frame, text="Process", command=self.process_files,
@@ -128,13 +165,30 @@ class App(ctk.CTk):
                                          fg_color=self.current_theme["button_bg"],
                                          hover_color=self.current_theme["button_hover"],
                                          text_color=self.current_theme["button_text"])
-        self.btn_process.grid(row=7, column=0, pady=(10, 20), sticky="n")
+        self.btn_process.grid(row=7, column=0, padx=(0, 160), pady=(10, 20), sticky="n")
+
+        # Cancel button; only active while the selected job is queued or running
+        self.btn_cancel = ctk.CTkButton(self.content_frame, text="Cancel", command=self.cancel_processing,
+                                        width=150, state="disabled",
+                                        fg_color=self.current_theme["button_bg"],
+                                        hover_color=self.current_theme["button_hover"],
+                                        text_color=self.current_theme["button_text"])
+        self.btn_cancel.grid(row=7, column=0, padx=(160, 0), pady=(10, 20), sticky="n")
 
         # Result label
         self.label_result = ctk.CTkLabel(self.content_frame, text="", fg_color=self.current_theme["bg"],
                                          text_color=self.current_theme["fg"])
         self.label_result.grid(row=8, column=0, pady=(10, 10), sticky="n")
 
+        # Submitted jobs, newest last; clicking one shows its status and preview
+        self.frame_jobs = ctk.CTkScrollableFrame(self.content_frame, height=90, fg_color=self.current_theme["bg"])
+        self.frame_jobs.grid(row=9, column=0, padx=(10, 10), pady=(0, 10), sticky="ew")
+
+        # Result preview: the first survivors while the job runs, then the whole result
+        self.preview_grid = PreviewGrid(self.content_frame, self.current_theme)
+        self.preview_grid.grid(row=10, column=0, padx=(10, 10), pady=(0, 10), sticky="nsew")
+        self.content_frame.grid_rowconfigure(10, weight=4)
+
     def apply_theme(self, theme):
         self.main_frame.configure(fg_color= theme["bg"])
         self.content_frame.configure(fg_color=theme["bg"])
@@ -143,6 +197,14 @@ class App(ctk.CTk):
         self.label_file_1.configure(fg_color=theme["bg"], text_color=theme["fg"])
         self.label_file_2.configure(fg_color=theme["bg"], text_color=theme["fg"])
         self.label_result.configure(fg_color=theme["bg"], text_color=theme["fg"])
+        self.preview_grid.apply_theme(theme)
+        self.frame_jobs.configure(fg_color=theme["bg"])
+        for button in self.job_buttons.values():
+            button.configure(fg_color=theme["bg"], hover_color=theme["button_hover"], text_color=theme["fg"])
+
+        self.frame_output_types.configure(fg_color=theme["bg"])
+        for checkbox in self.output_type_checkboxes.values():
+            checkbox.configure(fg_color=theme["button_bg"], hover_color=theme["button_hover"], text_color=theme["fg"])
 
         self.btn_select_file_1.configure(fg_color=theme["button_bg"], text_color=theme["button_text"],
                                          hover_color=theme["button_hover"])
@@ -152,6 +214,8 @@ class App(ctk.CTk):
                                         hover_color=theme["button_hover"])
         self.btn_process.configure(fg_color=theme["button_bg"], text_color=theme["button_text"],
                                    hover_color=theme["button_hover"])
+        self.btn_cancel.configure(fg_color=theme["button_bg"], text_color=theme["button_text"],
+                                  hover_color=theme["button_hover"])
 
     def toggle_theme(self):
         if self.animating:
@@ -193,35 +257,94 @@ class App(ctk.CTk):
     def update_label_result(self, text, color):
         self.label_result.configure(text=text, text_color=color)
 
+    def poll_jobs(self, interval=100):
+        """Handle the workers' messages; they run in other processes, so the GUI never waits on them."""
+        for kind, job_id, payload in self.jobs.poll():
+            if kind == "ready":
+                print(f"Worker ready:\n{payload}")
+                continue
+            if kind == "progress":
+                self.job_text[job_id] = ProgressReporter.describe(payload)
+            elif kind == "preview":
+                self.job_previews[job_id] = ListRows(payload.columns, payload.rows)
+            elif kind == "preview_file":
+                self.job_previews[job_id] = FeatherRows(payload)
+            elif kind == "result":
+                self.job_text[job_id] = f"Processing complete. Duplicates removed: {payload['duplicates_count']}"
+            elif kind == "cancelled":
+                self.job_text[job_id] = "Processing cancelled."
+            elif kind == "error":
+                self.job_text[job_id] = f"Error: {payload}"
+            if job_id == self.selected_job and kind in ("preview", "preview_file") and job_id in self.job_previews:
+                # Same rows, then all of them; the view stays where the user scrolled to
+                self.preview_grid.set_source(self.job_previews[job_id], keep_position=kind == "preview_file")
+        self.refresh_jobs()
+        self.after(interval, self.poll_jobs)
+
+    def job_summary(self, job_id):
+        job = self.jobs.jobs[job_id]
+        status = self.jobs.status[job_id]
+        detail = self.job_text.get(job_id, "Starting...") if status != "queued" else "Queued"
+        return f"#{job_id}  {len(job.file_paths)} files -> {os.path.basename(job.output_folder)}:  {detail}"
+
+    def refresh_jobs(self):
+        for job_id, button in self.job_buttons.items():
+            text = self.job_summary(job_id)
+            if button.cget("text") != text:
+                button.configure(text=text)
+        if self.selected_job is not None:
+            status = self.jobs.status[self.selected_job]
+            colors = {"done": "green", "cancelled": "orange", "error": "red"}
+            self.update_label_result(self.job_text.get(self.selected_job, status.capitalize()),
+                                     colors.get(status, self.current_theme["fg"]))
+            self.btn_cancel.configure(state="normal" if status in ("queued", "running") else "disabled")
+
+    def select_job(self, job_id):
+        self.selected_job = job_id
+        if job_id in self.job_previews:
+            self.preview_grid.set_source(self.job_previews[job_id])
+        else:
+            self.preview_grid.clear()
+        self.refresh_jobs()
+
+    def cancel_processing(self):
+        if self.selected_job is not None and self.jobs.status[self.selected_job] in ("queued", "running"):
+            self.jobs.cancel(self.selected_job)
+            self.btn_cancel.configure(state="disabled")
+            self.job_text[self.selected_job] = "Cancelling..."
+
+    def on_close(self):
+        self.jobs.stop()
+        self.preview_grid.clear()
+        self.destroy()
+        shutil.rmtree(self.preview_folder, ignore_errors=True)
+
     def process_files(self):
-        if not self.file_paths or not self.option_output_type.get():
+        output_types = [output_type for output_type, checkbox in self.output_type_checkboxes.items() if checkbox.get()]
+        if not self.file_paths or not output_types:
             self.label_result.configure(text="Please select files and output type", text_color="red")
             return
+        # Everything the run needs is collected here, on the Tk thread, before it starts
+        output_folder = filedialog.askdirectory()
+        if not output_folder:
+            self.label_result.configure(text="Output folder not selected", text_color="red")
+            return
 
-        output_type = self.option_output_type.get()
-
-        def thread_process():
-            try:
-                success, filtered_data, duplicates_count = DataProcessor.process_files(self.file_paths, output_type)
-                if success:
-                    result_text = f"Processing complete. Duplicates removed: {duplicates_count}"
-                    result_color = "green"
-                else:
-                    result_text = "Processing failed."
-                    result_color = "red"
-
-                self.after(0, lambda: self.update_label_result(result_text, result_color))
-
-                # Clear the file paths and reset file selection labels
-                self.file_paths = []
-                self.after(0, lambda: self.label_file_1.configure(text="No file selected"))
-                self.after(0, lambda: self.label_file_2.configure(text="No file selected"))
-
-            except Exception as e:
-                self.after(0, lambda: self.update_label_result(f"Error: {str(e)}", "red"))
-
-        threading.Thread(target=thread_process).start()
-
+        # The job keeps its own frozen copy of the files and options, so the next batch can be picked at once
+        preview_file = os.path.join(self.preview_folder, f"preview_{self.jobs.last_job + 1}.feather")
+        job_id = self.jobs.submit(self.file_paths, output_folder, output_types, preview_file)
+        self.job_buttons[job_id] = ctk.CTkButton(self.frame_jobs, text="", anchor="w",
+                                                 command=lambda: self.select_job(job_id),
+                                                 fg_color=self.current_theme["bg"],
+                                                 hover_color=self.current_theme["button_hover"],
+                                                 text_color=self.current_theme["fg"])
+        self.job_buttons[job_id].pack(fill="x")
+
+        # Clear the file paths and reset file selection labels
+        self.file_paths = []
+        self.label_file_1.configure(text="No file selected")
+        self.label_file_2.configure(text="No file selected")
+        self.select_job(job_id)
 
 if __name__ == "__main__":
     app = App()
@@ -0,0 +1,345 @@
+"""Local HTTP service for submitting lead files from scripts:
+
+    python service.py --port 8765 --data-dir service-data
+
+    curl -F file=@a.csv -F file=@b.csv -F output_type=CSV http://localhost:8765/jobs
+        -> {"job_id": "...", "status_url": "/jobs/..."}
+    curl http://localhost:8765/jobs/<job_id>                       status, progress and downloads
+    curl -O http://localhost:8765/jobs/<job_id>/files/output_combined_files.csv
+    curl -X DELETE http://localhost:8765/jobs/<job_id>             cancel
+
+Uploads are streamed to disk part by part, so memory stays bounded whatever their size; jobs run
+on the same JobQueue of worker processes as the desktop app.
+"""
+import argparse
+import json
+import os
+import re
+import shutil
+import threading
+import time
+import uuid
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+from ContactSets import ContactSets
+from Processor import DataProcessor
+from Worker import JobQueue
+
+CHUNK_SIZE = 1 << 16
+# Form fields are small; anything larger is rejected rather than buffered
+MAX_FIELD_SIZE = 1 << 16
+INPUT_EXTENSIONS = (".csv", ".xlsx", ".pdf")
+
+
+class MultipartStream:
+    """Incremental multipart/form-data parser reading at most CHUNK_SIZE bytes at a time.
+
+    for_each_part(open_part) calls open_part(name, filename) for every part; it returns a writable
+    sink that receives the part's body in pieces and is closed at the end of the part.
+    """
+
+    def __init__(self, stream, boundary, length):
+        self.stream = stream
+        self.remaining = length
+        self.delimiter = b"\r\n--" + boundary
+        # The leading CRLF makes the first boundary look like every later one
+        self.buffer = b"\r\n"
+
+    def read_more(self):
+        if self.remaining <= 0:
+            return False
+        data = self.stream.read(min(CHUNK_SIZE, self.remaining))
+        if not data:
+            return False
+        self.remaining -= len(data)
+        self.buffer += data
+        return True
+
+    def read_until(self, marker, sink=None):
+        """Consume up to and including marker, passing what comes before it to sink, or discarding it."""
+        keep = len(marker) - 1
+        while True:
+            index = self.buffer.find(marker)
+            if index >= 0:
+                if sink:
+                    sink.write(self.buffer[:index])
+                self.buffer = self.buffer[index + len(marker):]
+                return
+            # Everything except a possible partial marker at the end can go
+            if sink and len(self.buffer) > keep:
+                sink.write(self.buffer[:-keep])
+                self.buffer = self.buffer[-keep:]
+            elif not sink:
+                self.buffer = self.buffer[-keep:]
+            if not self.read_more():
+                raise ValueError("Truncated multipart body")
+
+    def for_each_part(self, open_part):
+        self.read_until(self.delimiter)
+        while True:
+            while len(self.buffer) < 2 and self.read_more():
+                pass
+            if self.buffer.startswith(b"--"):
+                return
+            headers = HeaderSink()
+            self.read_until(b"\r\n\r\n", headers)
+            name, filename = headers.disposition()
+            sink = open_part(name, filename)
+            try:
+                self.read_until(self.delimiter, sink)
+            finally:
+                sink.close()
+
+
+class HeaderSink:
+    """Collects the (small) header block of one part."""
+
+    def __init__(self):
+        self.data = b""
+
+    def write(self, data):
+        self.data += data
+        if len(self.data) > MAX_FIELD_SIZE:
+            raise ValueError("Multipart headers too large")
+
+    def close(self):
+        pass
+
+    def disposition(self):
+        """(name, filename) from the Content-Disposition header; filename is None for plain fields."""
+        text = self.data.decode("utf-8", "replace")
+        match = re.search(r"content-disposition:(.*)", text, re.IGNORECASE)
+        header = match.group(1) if match else ""
+        name = re.search(r'\bname="([^"]*)"', header)
+        filename = re.search(r'\bfilename="([^"]*)"', header)
+        return (name.group(1) if name else ""), (filename.group(1) if filename else None)
+
+
+class FieldSink(HeaderSink):
+    """Collects one form field's value."""
+
+    def __init__(self, fields, name):
+        super().__init__()
+        self.fields = fields
+        self.name = name
+
+    def close(self):
+        self.fields.setdefault(self.name, []).append(self.data.decode("utf-8").strip())
+
+
+class DedupService:
+    """Job bookkeeping behind the HTTP handler; every JobQueue call goes through one lock."""
+
+    POLL_INTERVAL = 0.1
+
+    def __init__(self, data_dir, max_workers=None, index_path=None):
+        self.data_dir = os.path.abspath(data_dir)
+        self.index_path = index_path
+        # Jobs sharing an index run one at a time: each must see the keys the previous one added
+        self.queue = JobQueue(1 if index_path else max_workers)
+        self.lock = threading.Lock()
+        self.jobs = {}
+        # JobQueue job id -> service job id
+        self.queue_ids = {}
+        self.poller = threading.Thread(target=self.poll, daemon=True)
+        self.poller.start()
+
+    def job_folder(self, job_id):
+        return os.path.join(self.data_dir, "jobs", job_id)
+
+    def new_job(self):
+        job_id = uuid.uuid4().hex[:12]
+        os.makedirs(os.path.join(self.job_folder(job_id), "input"))
+        return job_id
+
+    def submit(self, job_id, file_paths, fields):
+        """Queue an uploaded job with the options from its form fields."""
+        output_types = fields.get("output_type") or ["CSV"]
+        output_folder = os.path.join(self.job_folder(job_id), "output")
+        match_mode = (fields.get("match_mode") or ["subset"])[0]
+        if match_mode not in ContactSets.MODES:
+            raise ValueError(f"Unknown matching mode: {match_mode}")
+        options = {
+            "match_mode": match_mode,
+            "suppressed_statuses": fields.get("suppressed_status", []),
+            "csv_compression": (fields.get("csv_compression") or [None])[0],
+            "partition_by": fields.get("partition_by") or None,
+            "zip_prefix": int((fields.get("zip_prefix") or [3])[0]),
+        }
+        # Bad settings are a 400 now, not a job failing once it reaches its writers
+        DataProcessor.check_arguments(file_paths, output_folder, output_types, options["csv_compression"],
+                                      options["partition_by"])
+        if self.index_path:
+            options.update(index_path=self.index_path, incremental="incremental" in fields)
+        with self.lock:
+            queue_id = self.queue.submit(file_paths, output_folder, output_types, **options)
+            self.queue_ids[queue_id] = job_id
+            self.jobs[job_id] = {"job_id": job_id, "queue_id": queue_id, "submitted": time.time(),
+                                 "files": [os.path.basename(path) for path in file_paths], "progress": {},
+                                 "result": None, "error": None}
+
+    def poll(self):
+        """Background loop moving worker messages into the job records."""
+        while True:
+            with self.lock:
+                for kind, queue_id, payload in self.queue.poll():
+                    job = self.jobs.get(self.queue_ids.get(queue_id))
+                    if job is None:
+                        continue
+                    if kind == "progress":
+                        job["progress"][payload.stage] = {"done": payload.done, "total": payload.total,
+                                                          "rate": round(payload.rate, 1), "eta": payload.eta}
+                    elif kind == "result":
+                        job["result"] = payload
+                    elif kind == "error":
+                        job["error"] = payload
+            time.sleep(DedupService.POLL_INTERVAL)
+
+    def job_ids(self):
+        with self.lock:
+            return sorted(self.jobs)
+
+    def status(self, job_id):
+        with self.lock:
+            job = self.jobs.get(job_id)
+            if job is None:
+                return None
+            report = {key: value for key, value in job.items() if key not in ("queue_id", "result", "progress")}
+            report["progress"] = {stage: dict(values) for stage, values in job["progress"].items()}
+            report["status"] = self.queue.status[job["queue_id"]]
+            result = job["result"]
+        if result:
+            report["result"] = {key: result[key] for key in
+                                ("rows_loaded", "rows_suppressed", "duplicates_count", "rows_written")}
+            report["downloads"] = [f"/jobs/{job_id}/files/{name}" for name in self.output_names(job_id)]
+        return report
+
+    def output_names(self, job_id):
+        """Files under the job's output folder, as paths relative to it."""
+        output = os.path.join(self.job_folder(job_id), "output")
+        names = []
+        for folder, _, files in os.walk(output):
+            names.extend(os.path.relpath(os.path.join(folder, name), output).replace(os.sep, "/") for name in files)
+        return sorted(names)
+
+    def output_file(self, job_id, name):
+        """The path of a downloadable output, or None; names cannot leave the job's output folder."""
+        output = os.path.join(self.job_folder(job_id), "output")
+        path = os.path.realpath(os.path.join(output, name))
+        if os.path.commonpath([path, os.path.realpath(output)]) != os.path.realpath(output):
+            return None
+        return path if os.path.isfile(path) else None
+
+    def cancel(self, job_id):
+        with self.lock:
+            job = self.jobs.get(job_id)
+            if job is not None:
+                self.queue.cancel(job["queue_id"])
+            return job is not None
+
+    def stop(self):
+        with self.lock:
+            self.queue.stop()
+
+
+class ServiceHandler(BaseHTTPRequestHandler):
+    """Routes: POST /jobs, GET /jobs, GET /jobs/<id>, GET /jobs/<id>/files/<name>, DELETE /jobs/<id>."""
+
+    service = None
+
+    def send_json(self, code, data):
+        body = json.dumps(data, default=str).encode()
+        self.send_response(code)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def route(self):
+        return [part for part in self.path.split("?")[0].split("/") if part]
+
+    def do_POST(self):
+        if self.route() != ["jobs"]:
+            return self.send_json(404, {"error": "not found"})
+        match = re.search(r'boundary="?([^";]+)"?', self.headers.get("Content-Type", ""))
+        length = self.headers.get("Content-Length") or ""
+        length = int(length) if length.isdigit() else 0
+        if not match or not length:
+            return self.send_json(400, {"error": "expected a multipart/form-data upload with a Content-Length"})
+
+        job_id = self.service.new_job()
+        input_folder = os.path.join(self.service.job_folder(job_id), "input")
+        fields, file_paths = {}, []
+
+        def open_part(name, filename):
+            if filename is None:
+                return FieldSink(fields, name)
+            filename = os.path.basename(filename.replace("\\", "/"))
+            if not filename.lower().endswith(INPUT_EXTENSIONS):
+                raise ValueError(f"Unsupported file format for {filename}")
+            # Prefix with the part number, so two uploads with the same name do not collide
+            path = os.path.join(input_folder, f"{len(file_paths):03d}_{filename}")
+            file_paths.append(path)
+            return open(path, "wb")
+
+        try:
+            MultipartStream(self.rfile, match.group(1).encode(), length).for_each_part(open_part)
+            if not file_paths:
+                raise ValueError("No files uploaded")
+            self.service.submit(job_id, file_paths, fields)
+        except ValueError as e:
+            shutil.rmtree(self.service.job_folder(job_id), ignore_errors=True)
+            return self.send_json(400, {"error": str(e)})
+        self.send_json(202, {"job_id": job_id, "status_url": f"/jobs/{job_id}"})
+
+    def do_GET(self):
+        route = self.route()
+        if route == ["jobs"]:
+            return self.send_json(200, {"jobs": self.service.job_ids()})
+        if len(route) == 2 and route[0] == "jobs":
+            status = self.service.status(route[1])
+            return self.send_json(200, status) if status else self.send_json(404, {"error": "unknown job"})
+        if len(route) >= 4 and route[0] == "jobs" and route[2] == "files":
+            path = self.service.output_file(route[1], "/".join(route[3:]))
+            if path is None:
+                return self.send_json(404, {"error": "no such output"})
+            self.send_response(200)
+            self.send_header("Content-Type", "application/octet-stream")
+            self.send_header("Content-Length", str(os.path.getsize(path)))
+            self.send_header("Content-Disposition", f'attachment; filename="{os.path.basename(path)}"')
+            self.end_headers()
+            with open(path, "rb") as handle:
+                shutil.copyfileobj(handle, self.wfile, CHUNK_SIZE)
+            return
+        self.send_json(404, {"error": "not found"})
+
+    def do_DELETE(self):
+        route = self.route()
+        if len(route) == 2 and route[0] == "jobs" and self.service.cancel(route[1]):
+            return self.send_json(202, {"job_id": route[1], "status": "cancelling"})
+        self.send_json(404, {"error": "unknown job"})
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Serve the dedup pipeline over HTTP on this machine.")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8765)
+    parser.add_argument("--data-dir", default="service-data", help="where uploads and outputs are kept")
+    parser.add_argument("--workers", type=int, help="jobs run at the same time (default: half the cores)")
+    parser.add_argument("--index", help="persistent dedup index shared by all jobs (they then run one at a time)")
+    args = parser.parse_args(argv)
+
+    ServiceHandler.service = DedupService(args.data_dir, args.workers, args.index)
+    server = ThreadingHTTPServer((args.host, args.port), ServiceHandler)
+    print(f"Serving on http://{args.host}:{args.port}")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+        ServiceHandler.service.stop()
+
+
+if __name__ == "__main__":
+    main()